@@ -0,0 +1,279 @@
+"""
+たたかえ！こうかとん のバッチ実行（モンテカルロによるバランス調整用）
+
+ヘッドレスのゲームをProcessPoolExecutorで全コアに分散して大量に実行し，
+1ゲームごとの結果（スコア・生存フレーム数・発射したビーム数・オーバーチャージ数）を
+終わった順にCSV（またはParquetの行グループ）へ書き出す．
+同時に投入するジョブ数には上限があるので，ゲーム数が多くてもメモリは増え続けない．
+爆弾の数・オーバーチャージの閾値・スコアの式の係数・操作の方策を組み合わせて掃引できる．
+
+使い方：
+    python batch.py --games 1000 --num-bombs 5,10,20 --max-charge 120,150 --out sweep.csv
+    python batch.py --games 200 --policy random,scripted --out sweep.parquet
+"""
+import argparse
+import csv
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import pygame as pg
+
+import fight_kokaton as fk
+
+
+# 結果の列（順番はCSVの列順）
+FIELDS = ("policy", "num_bombs", "max_charge", "score_base", "score_charge_div", "seed",
+          "score", "ticks", "end", "beams_fired", "overcharges")
+POLICIES = ("random", "scripted", "idle")  # 操作の方策の名前
+PARQUET_ROW_GROUP = 4096  # Parquetの1つの行グループにまとめる行数
+
+
+class ScriptedBot:
+    """
+    8方向を順に巡回しながら，決まったフレーム数だけチャージしてビームを撃つ方策
+    """
+    def __init__(self, charge_ticks: int = 30, turn: int = 20):
+        """
+        引数1 charge_ticks：スペースキーを押し続けるフレーム数
+        引数2 turn：同じ方向に進むフレーム数
+        """
+        self.charge_ticks = charge_ticks
+        self.turn = turn
+        self.dires = [
+            {pg.K_RIGHT}, {pg.K_RIGHT, pg.K_UP}, {pg.K_UP}, {pg.K_LEFT, pg.K_UP},
+            {pg.K_LEFT}, {pg.K_LEFT, pg.K_DOWN}, {pg.K_DOWN}, {pg.K_RIGHT, pg.K_DOWN},
+        ]
+
+    def __call__(self, tick: int) -> tuple[list, set[int]]:
+        events = []
+        phase = tick % (self.charge_ticks + 1)
+        if phase == 0:
+            events.append(pg.event.Event(pg.KEYDOWN, key=pg.K_SPACE))
+        elif phase == self.charge_ticks:
+            events.append(pg.event.Event(pg.KEYUP, key=pg.K_SPACE))
+        return events, self.dires[tick // self.turn % len(self.dires)]
+
+
+def make_policy(name: str, seed: int):
+    """
+    方策の名前から方策を生成する
+    引数1 name：POLICIESのいずれか
+    引数2 seed：方策の乱数シード
+    """
+    if name == "random":
+        return fk.RandomPolicy(seed)
+    if name == "scripted":
+        return ScriptedBot()
+    if name == "idle":
+        return fk.idle_policy
+    raise ValueError(f"未知の方策です: {name}")
+
+
+def init_worker():
+    """
+    ワーカープロセスの初期化（画像などの読み込みはプロセスごとに1回だけ行う）
+    """
+    fk.use_dummy_video()
+    pg.init()
+    fk.preload()
+
+
+def run_chunk(jobs: list[dict]) -> list[dict]:
+    """
+    複数のゲームをまとめて実行する（プロセス間のやり取りの回数を減らすため）
+    """
+    return [run_game(job) for job in jobs]
+
+
+def run_game(job: dict) -> dict:
+    """
+    ヘッドレスで1ゲームを最後まで（またはmax_ticksまで）描画せずに進める
+    引数 job：パラメータの辞書（FIELDSのうち結果以外の項目とmax_ticks）
+    戻り値：パラメータに結果を加えた辞書
+    """
+    world = fk.World(job["seed"], job["num_bombs"], max_charge=job["max_charge"],
+                     score_base=job["score_base"], score_charge_div=job["score_charge_div"])
+    source = fk.ScriptedInput(make_policy(job["policy"], job["seed"]))
+    end = "timeout"
+    while world.tmr < job["max_ticks"]:
+        events, key_lst = source.poll()
+        status = world.step(events, key_lst)
+        if status is not None:
+            end = status
+            break
+        if not world.bombs:
+            end = "clear"
+            break
+    result = {key: job[key] for key in FIELDS if key in job}
+    result.update(score=world.score.score, ticks=world.tmr, end=end,
+                  beams_fired=world.beams_fired, overcharges=world.overcharges)
+    return result
+
+
+def make_jobs(args: argparse.Namespace):
+    """
+    掃引するパラメータの全組み合わせ×ゲーム数のジョブを生成する
+    """
+    grid = itertools.product(args.policy, args.num_bombs, args.max_charge,
+                             args.score_base, args.score_charge_div)
+    for policy, num_bombs, max_charge, score_base, score_charge_div in grid:
+        for i in range(args.games):
+            yield {"policy": policy, "num_bombs": num_bombs, "max_charge": max_charge,
+                   "score_base": score_base, "score_charge_div": score_charge_div,
+                   "seed": args.seed + i, "max_ticks": args.max_ticks}
+
+
+class ResultWriter:
+    """
+    結果を1行ずつ書き出すクラス（.parquetならpyarrowでrow_group行ごとの行グループにして書き出す）
+    """
+    def __init__(self, path: str | None, row_group: int = PARQUET_ROW_GROUP):
+        """
+        引数1 path：出力ファイルのパス（Noneなら標準出力にCSV）
+        引数2 row_group：Parquetの1つの行グループにまとめる行数
+        """
+        self.parquet = path is not None and path.endswith(".parquet")
+        self.path = path
+        self.row_group = row_group
+        self.rows: list[dict] = []  # まだ書き出していないParquetの行
+        self.pq_writer = None
+        if self.parquet:
+            import pyarrow  # noqa: F401  Parquetを書くときだけ必要
+            self.f = None
+        else:
+            self.f = open(path, "w", newline="", encoding="utf-8") if path else sys.stdout
+            self.csv = csv.DictWriter(self.f, FIELDS)
+            self.csv.writeheader()
+
+    def write(self, row: dict):
+        if self.parquet:
+            self.rows.append(row)
+            if len(self.rows) >= self.row_group:
+                self._flush_rows()
+        else:
+            self.csv.writerow(row)
+
+    def _flush_rows(self):
+        """
+        溜まっている行を1つの行グループとしてParquetに書き出す
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.Table.from_pylist(self.rows)
+        if self.pq_writer is None:
+            self.pq_writer = pq.ParquetWriter(self.path, table.schema)
+        self.pq_writer.write_table(table.cast(self.pq_writer.schema))
+        self.rows = []
+
+    def close(self):
+        if self.parquet:
+            if self.rows:
+                self._flush_rows()
+            if self.pq_writer is not None:
+                self.pq_writer.close()
+        elif self.f is not sys.stdout:
+            self.f.close()
+
+
+def summarize(summary: dict, row: dict):
+    """
+    パラメータの組み合わせごとに結果を集計する
+    """
+    key = tuple(row[k] for k in ("policy", "num_bombs", "max_charge", "score_base", "score_charge_div"))
+    acc = summary.setdefault(key, {"games": 0, "score": 0, "ticks": 0, "beams_fired": 0, "overcharges": 0})
+    acc["games"] += 1
+    for k in ("score", "ticks", "beams_fired", "overcharges"):
+        acc[k] += row[k]
+
+
+def chunked(jobs, size: int):
+    """
+    ジョブをsize個ずつのリストにまとめる
+    """
+    it = iter(jobs)
+    while chunk := list(itertools.islice(it, size)):
+        yield chunk
+
+
+def policy_list(text: str) -> list[str]:
+    names = text.split(",")
+    for name in names:
+        if name not in POLICIES:
+            raise argparse.ArgumentTypeError(f"未知の方策です: {name}（{', '.join(POLICIES)} から選ぶ）")
+    return names
+
+
+def int_list(text: str) -> list[int]:
+    return [int(v) for v in text.split(",")]
+
+
+def float_list(text: str) -> list[float]:
+    return [float(v) for v in text.split(",")]
+
+
+def main(argv: list[str] | None = None) -> dict:
+    """
+    バッチ実行のメイン処理
+    引数 argv：コマンドライン引数のリスト（Noneならsys.argv）
+    戻り値：パラメータの組み合わせごとの集計結果
+    """
+    parser = argparse.ArgumentParser(description="たたかえ！こうかとん バッチ実行")
+    parser.add_argument("--games", type=int, default=100, help="パラメータの組み合わせごとのゲーム数")
+    parser.add_argument("--policy", type=policy_list, default=["random"],
+                        help="操作の方策（" + ",".join(POLICIES) + " をカンマ区切り）")
+    parser.add_argument("--num-bombs", type=int_list, default=[fk.NUM_OF_BOMBS], help="爆弾の数（カンマ区切り）")
+    parser.add_argument("--max-charge", type=int_list, default=[fk.MAX_BEAM_CHARGE],
+                        help="オーバーチャージの閾値（カンマ区切り）")
+    parser.add_argument("--score-base", type=int_list, default=[fk.SCORE_BASE],
+                        help="スコアの式 base*(1+charge/div) のbase（カンマ区切り）")
+    parser.add_argument("--score-charge-div", type=float_list, default=[fk.SCORE_CHARGE_DIV],
+                        help="スコアの式 base*(1+charge/div) のdiv（カンマ区切り）")
+    parser.add_argument("--max-ticks", type=int, default=3000, help="1ゲームの最大フレーム数")
+    parser.add_argument("--seed", type=int, default=0, help="最初のゲームの乱数シード")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="ワーカープロセス数")
+    parser.add_argument("--chunksize", type=int, default=16, help="1回にワーカーへ渡すゲーム数")
+    parser.add_argument("--inflight", type=int, default=4,
+                        help="ワーカー1つあたりに同時に投入しておくまとまりの数")
+    parser.add_argument("--out", default=None, help="出力ファイル（.csv/.parquet，省略時は標準出力にCSV）")
+    args = parser.parse_args(argv)
+
+    writer = ResultWriter(args.out)
+    summary: dict = {}
+    start = time.perf_counter()
+    n = 0
+    # 投入済みで終わっていないまとまりを上限以下に保ち，終わったものから書き出す
+    limit = max(1, args.workers * args.inflight)
+    chunks = chunked(make_jobs(args), args.chunksize)
+    try:
+        with ProcessPoolExecutor(args.workers, initializer=init_worker) as executor:
+            running = set()
+            while True:
+                for chunk in itertools.islice(chunks, limit - len(running)):
+                    running.add(executor.submit(run_chunk, chunk))
+                if not running:
+                    break
+                finished, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    for row in future.result():
+                        writer.write(row)
+                        summarize(summary, row)
+                        n += 1
+    finally:
+        writer.close()
+    elapsed = time.perf_counter() - start
+
+    print(f"{n} games in {elapsed:.1f} s ({n / elapsed:.1f} games/s, {args.workers} workers)", file=sys.stderr)
+    for key, acc in summary.items():
+        g = acc["games"]
+        print("policy={} bombs={} max_charge={} score={}*(1+c/{}): ".format(*key)
+              + f"score {acc['score'] / g:.1f}  ticks {acc['ticks'] / g:.1f}  "
+              f"beams {acc['beams_fired'] / g:.1f}  overcharges {acc['overcharges'] / g:.2f}",
+              file=sys.stderr)
+    return summary
+
+
+if __name__ == "__main__":
+    main()
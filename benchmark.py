@@ -0,0 +1,562 @@
+"""
+たたかえ！こうかとん のベンチマーク
+
+名前付きのシナリオを固定シードで実際のクラスを使って動かし，
+フレームの各処理（衝突判定・爆弾・こうかとん・ビーム・爆発・テキスト・画面更新）
+ごとの所要時間のパーセンタイルをJSONに出力する．
+
+使い方：
+    python benchmark.py                       # 全シナリオ
+    python benchmark.py -s bombs_500 -s burst  # シナリオを選んで実行
+    python benchmark.py --out bench.json
+    python benchmark.py --suite alloc          # プールの有無による割り当て量の比較
+    python benchmark.py --suite startup        # import時間と最初の画面が出るまでの時間
+    python benchmark.py --suite backends       # 描画方式（Surface／SDLのTexture）の比較
+    python benchmark.py --suite pipeline       # 直列のループとシミュレーション／描画の2スレッドの比較
+    python benchmark.py --suite atlas          # 大爆発の描画（円を毎回描く／画像集から転送）の比較
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pygame as pg
+
+import fight_kokaton as fk
+
+
+# 計測するフレーム内の処理（表示順）
+PHASES = ("background", "collision", "bombs", "bird", "beams", "explosions", "text", "flip")
+
+
+class PhaseTimer:
+    """
+    フレーム内の処理ごとの所要時間を記録するクラス
+    """
+    def __init__(self):
+        self.samples: dict[str, list[float]] = {name: [] for name in PHASES}
+        self.frames: list[float] = []
+        self.frame_start = 0.0
+        self.last = 0.0
+        self.current: dict[str, float] = {}
+
+    def begin(self):
+        """
+        フレームの計測を開始する
+        """
+        self.frame_start = self.last = time.perf_counter()
+        self.current = dict.fromkeys(PHASES, 0.0)
+
+    def lap(self, name: str):
+        """
+        直前のlap（またはbegin）からの経過時間をnameの処理に加算する
+        """
+        now = time.perf_counter()
+        self.current[name] += now - self.last
+        self.last = now
+
+    def end(self):
+        """
+        フレームの計測を終了する
+        """
+        for name, sec in self.current.items():
+            self.samples[name].append(sec)
+        self.frames.append(self.last - self.frame_start)
+
+    def report(self) -> dict:
+        """
+        処理ごとのp50/p95/p99（ミリ秒）をまとめた辞書を返す
+        """
+        def summary(values: list[float]) -> dict:
+            ms = np.asarray(values) * 1000
+            p50, p95, p99 = np.percentile(ms, (50, 95, 99))
+            return {"p50_ms": round(float(p50), 4), "p95_ms": round(float(p95), 4),
+                    "p99_ms": round(float(p99), 4), "mean_ms": round(float(ms.mean()), 4)}
+        return {
+            "frames": len(self.frames),
+            "frame": summary(self.frames),
+            "phases": {name: summary(values) for name, values in self.samples.items()},
+        }
+
+
+class NullTimer:
+    """
+    時間を計らないときに使う何もしないタイマー
+    """
+    def begin(self):
+        pass
+
+    def lap(self, name: str):
+        pass
+
+    def end(self):
+        pass
+
+
+def run_frame(world: fk.World, renderer: fk.Renderer,
+              charge_bar: fk.ChargeBar, events, key_lst, timer: PhaseTimer):
+    """
+    main()と同じ順序で1フレームを進め，処理ごとの時間を計る
+    ベンチマークではこうかとんは被弾しても止まらない
+    """
+    timer.begin()
+    world.handle_events(events)
+    world.update_charge()
+    renderer.begin()
+    timer.lap("background")
+    world.collide()
+    world.compact()
+    timer.lap("collision")
+    world.move_bombs()
+    world.bombs.draw(renderer)
+    timer.lap("bombs")
+    world.move_bird(key_lst)
+    world.bird.draw(renderer)
+    timer.lap("bird")
+    world.move_beams()
+    for beam in world.beams:
+        beam.draw(renderer)
+    timer.lap("beams")
+    world.step_explosions()
+    for exp in world.explosions:
+        exp.draw(renderer)
+    if world.big_explosion is not None and world.big_explosion.life > 0:
+        world.big_explosion.step()
+        world.big_explosion.draw(renderer)
+    timer.lap("explosions")
+    world.score.draw(renderer)
+    charge_bar.draw(renderer, world.bird.charge)
+    timer.lap("text")
+    renderer.present()
+    timer.lap("flip")
+    timer.end()
+    world.tmr += 1
+
+
+def bombs_scenario(num_bombs: int):
+    """
+    爆弾num_bombs個の中をランダム操作のこうかとんが撃ち続けるシナリオを返す
+    """
+    def setup(seed: int):
+        world = fk.World(seed, num_bombs)
+        return world, fk.ScriptedInput(fk.RandomPolicy(seed))
+    return setup
+
+
+def burst_setup(seed: int):
+    """
+    最大チャージのビーム200本を8方向に一斉に撃つシナリオ
+    """
+    world = fk.World(seed)
+    bird = world.bird
+    bird.rct.center = (fk.WIDTH // 2, fk.HEIGHT // 2)
+    dires = list(fk.Bird.sprites.imgs)
+    for i in range(200):
+        bird.dire = dires[i % len(dires)]
+        world.beams.append(fk.Beam(bird, fk.MAX_BEAM_CHARGE))
+    return world, fk.ScriptedInput(fk.idle_policy)
+
+
+def overcharge_setup(seed: int):
+    """
+    オーバーチャージによる大爆発の演出を最後まで流すシナリオ
+    """
+    world = fk.World(seed)
+    world.charging = True
+    world.bird.charge = fk.MAX_BEAM_CHARGE
+    world.update_charge()
+    return world, fk.ScriptedInput(fk.idle_policy)
+
+
+def explosions_setup(seed: int):
+    """
+    最大チャージの爆発50個が常に同時に表示されているシナリオ
+    """
+    world = fk.World(seed)
+    rng = world.rng
+
+    def policy(tick: int):
+        # 消えた爆発を補充して常に50個にする
+        while len(world.explosions) < 50:
+            xy = rng.randint(0, fk.WIDTH), rng.randint(0, fk.HEIGHT)
+            world.explosions.append(fk.Explosion(xy, fk.MAX_BEAM_CHARGE))
+        return [], set()
+    return world, fk.ScriptedInput(policy)
+
+
+# 描画方式の比較に使うシナリオ（爆弾・ビーム・パーティクルが多い場面）
+BACKEND_SCENARIOS = ("bombs_5000", "burst", "overcharge")
+BACKENDS = ("full", "texture")
+
+# 2スレッドの比較に使う爆弾の数
+PIPELINE_BOMBS = (500, 5000, 20000)
+
+# シナリオ名 -> (準備関数, 既定のフレーム数)
+SCENARIOS = {
+    "bombs_5": (bombs_scenario(5), 500),
+    "bombs_500": (bombs_scenario(500), 300),
+    "bombs_5000": (bombs_scenario(5000), 100),
+    "bombs_20000": (bombs_scenario(20000), 100),
+    "burst": (burst_setup, 120),
+    "overcharge": (overcharge_setup, 60),
+    "explosions_50": (explosions_setup, 200),
+}
+
+
+def run_scenario(name: str, seed: int, frames: int | None = None, renderer: str = "full",
+                 driver: str | None = None) -> dict:
+    """
+    シナリオを1つ実行して計測結果を返す
+    引数1 name：シナリオ名
+    引数2 seed：乱数シード
+    引数3 frames：フレーム数（Noneならシナリオの既定値）
+    引数4 renderer：描画方式（"full"，"dirty"，"texture"）
+    引数5 driver：textureで使うSDLのレンダラーのドライバ名
+    """
+    setup, default_frames = SCENARIOS[name]
+    screen = pg.display.get_surface()
+    bg_img = pg.image.load(fk.asset_path("fig/pg_bg.jpg")).convert()
+    renderer = fk.make_renderer(renderer, screen, bg_img, driver)
+    world, source = setup(seed)
+    charge_bar = fk.ChargeBar()
+    timer = PhaseTimer()
+    for _ in range(frames or default_frames):
+        events, key_lst = source.poll()
+        run_frame(world, renderer, charge_bar, events, key_lst, timer)
+    result = timer.report()
+    result["seed"] = seed
+    # 画像キャッシュの常駐メモリ
+    result["caches"] = {"sprite": fk.sprite_cache.stats(), "text": fk.text_cache.stats(),
+                        "explosion": fk.Explosion.frames.stats()}
+    return result
+
+
+def run_alloc(seed: int, frames: int, pooling: bool, warmup: int = 200) -> dict:
+    """
+    爆弾500個の中で撃ち続けたときの定常状態のメモリ割り当てを計測する
+    引数1 seed：乱数シード
+    引数2 frames：計測するフレーム数
+    引数3 pooling：ビームと爆発エフェクトをプールから再利用するか
+    引数4 warmup：計測前に進めるフレーム数
+    戻り値：1000フレームあたりのGC回数とtracemallocの計測結果
+    """
+    import tracemalloc
+
+    screen = pg.display.get_surface()
+    bg_img = pg.image.load(fk.asset_path("fig/pg_bg.jpg")).convert()
+    renderer = fk.make_renderer("full", screen, bg_img)
+    world = fk.World(seed, 500, pooling)
+    source = fk.ScriptedInput(fk.RandomPolicy(seed))
+    charge_bar = fk.ChargeBar()
+    timer = NullTimer()
+
+    def frame():
+        events, key_lst = source.poll()
+        run_frame(world, renderer, charge_bar, events, key_lst, timer)
+
+    for _ in range(warmup):
+        frame()
+    created = world.beam_pool.created + world.explosion_pool.created
+    gc.collect()
+    before = [st["collections"] for st in gc.get_stats()]
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    for _ in range(frames):
+        frame()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    after = [st["collections"] for st in gc.get_stats()]
+    per = 1000 / frames
+    return {
+        "pooling": pooling,
+        "frames": frames,
+        "gc_collections_per_1000": {f"gen{i}": round((a - b) * per, 2)
+                                    for i, (a, b) in enumerate(zip(after, before))},
+        "entities_created_per_1000": round(
+            (world.beam_pool.created + world.explosion_pool.created - created) * per, 2),
+        "traced_growth_bytes": current - start,
+        "traced_peak_bytes": peak - start,
+    }
+
+
+# 新しいプロセスでimportから最初の画面までを計測するスクリプト（引数：パッケージの場所，先読みの方式）
+STARTUP_SCRIPT = """
+import sys, time
+sys.path.insert(0, sys.argv[1])
+import numpy, pygame as pg
+t0 = time.perf_counter()
+import fight_kokaton as fk
+t1 = time.perf_counter()
+fk.use_dummy_video()
+pg.init()
+screen = pg.display.set_mode((fk.WIDTH, fk.HEIGHT))
+if sys.argv[2] == "sync":
+    fk.preload(warm_beams=True)
+elif sys.argv[2] == "background":
+    fk.start_preloader(warm_beams=True)
+bg_img = pg.image.load(fk.asset_path("fig/pg_bg.jpg")).convert()
+renderer = fk.make_renderer("full", screen, bg_img)
+world = fk.World(0)
+renderer.begin()
+world.draw(renderer, fk.ChargeBar())
+renderer.present()
+t2 = time.perf_counter()
+print((t1 - t0) * 1000, (t2 - t1) * 1000)
+"""
+
+
+def run_startup(repeat: int) -> dict:
+    """
+    importにかかる時間と，importから最初の画面を出すまでの時間を計測する
+    毎回新しいプロセスで，このファイルとは別の作業ディレクトリから起動する
+    引数 repeat：先読みの方式ごとの計測回数
+    戻り値：先読みの方式（lazy：しない，sync：最初の画面の前に行う，background：裏で行う）ごとの中央値
+    """
+    package = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for mode in ("lazy", "sync", "background"):
+        samples = []
+        for _ in range(repeat):
+            out = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT, package, mode],
+                                 cwd=tempfile.gettempdir(), capture_output=True, text=True, check=True)
+            samples.append([float(v) for v in out.stdout.split()[-2:]])
+        import_ms, first_frame_ms = np.median(np.asarray(samples), axis=0)
+        results[mode] = {"import_ms": round(float(import_ms), 3),
+                         "first_frame_ms": round(float(first_frame_ms), 3), "repeat": repeat}
+    return results
+
+
+def run_backends(seed: int, frames: int | None, driver: str) -> dict:
+    """
+    爆弾・ビーム・パーティクルの多いシナリオを描画方式ごとに実行して比較する
+    引数1 seed：乱数シード
+    引数2 frames：各シナリオのフレーム数（Noneならシナリオの既定値）
+    引数3 driver：textureで使うSDLのレンダラーのドライバ名
+    戻り値：シナリオごとの描画方式別のフレーム時間と速かった描画方式
+    """
+    results = {}
+    for name in BACKEND_SCENARIOS:
+        res = {kind: run_scenario(name, seed, frames, kind, driver)["frame"] for kind in BACKENDS}
+        res["winner"] = min(BACKENDS, key=lambda kind: res[kind]["p50_ms"])
+        results[name] = res
+    return results
+
+
+class InvincibleWorld(fk.World):
+    """
+    こうかとんが被弾しても止まらないWorld（ベンチマークで場面を変えないため）
+    """
+    def collide(self) -> bool:
+        super().collide()
+        return False
+
+
+def run_pipeline(seed: int, frames: int, num_bombs: int, pipeline: bool) -> dict:
+    """
+    爆弾num_bombs個の中を撃ち続けるゲームを，直列のループまたは2スレッドで進めて描画する
+    引数1 seed：乱数シード
+    引数2 frames：フレーム数
+    引数3 num_bombs：爆弾の数
+    引数4 pipeline：Trueならシミュレーションを別スレッドで1フレーム先に進める
+    戻り値：フレーム時間のパーセンタイルと1秒あたりのフレーム数
+    """
+    screen = pg.display.get_surface()
+    bg_img = pg.image.load(fk.asset_path("fig/pg_bg.jpg")).convert()
+    renderer = fk.make_renderer("full", screen, bg_img)
+    game = fk.Game(seed, num_bombs)
+    game.world = InvincibleWorld(seed, num_bombs)
+    source = fk.ScriptedInput(fk.RandomPolicy(seed))
+    charge_bar = fk.ChargeBar()
+    sim = None
+    if pipeline:
+        sim = fk.SimulationThread(game, charge_bar)
+        sim.start()
+    times = []
+    start = time.perf_counter()
+    for _ in range(frames):
+        t = time.perf_counter()
+        events, key_lst = source.poll()
+        if sim is None:
+            fk.run_ticks(game, events, key_lst, 1)
+            renderer.begin()
+            game.draw(renderer, charge_bar)
+        else:
+            sim.submit(events, key_lst, 1)
+            snap = sim.take()
+            renderer.begin()
+            snap.draw(renderer)
+        renderer.present()
+        times.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+    if sim is not None:
+        sim.stop()
+    p50, p95 = np.percentile(np.asarray(times) * 1000, (50, 95))
+    return {"p50_ms": round(float(p50), 4), "p95_ms": round(float(p95), 4),
+            "fps": round(frames / elapsed, 2), "score": game.world.score.score}
+
+
+def draw_circles(big: fk.BigExplosion, renderer: fk.Renderer):
+    """
+    画像集を使わず，輪とパーティクルを毎フレームpg.draw.circleで画面Surfaceに直接描く
+    （比較用の以前の描き方．画面Surfaceを持つ描画方式でだけ使える）
+    """
+    screen, circle = renderer.surface, pg.draw.circle
+    fade = int(255 * (1 - big.shockwave_radius / big.shockwave_max))
+    if big.shockwave_radius > 0 and fade > 0:
+        for i in range(big.rings):
+            radius = big.shockwave_radius - i * 20
+            if radius > 0:
+                renderer.mark(circle(screen, (255, 200 - i * 50, 0), big.center, int(radius), max(1, 5 - i)))
+    ps = big.particles
+    n = ps.n
+    if n == 0:
+        return
+    ratio = ps.life[:n] / ps.max_life[:n]
+    radius = np.maximum(1, (ps.size[:n] * ratio).astype(np.int32))
+    color = (np.asarray(ps.atlas.palette)[ps.shade[:n]] * ratio[:, None]).astype(np.int32)
+    rects = [circle(screen, c, xy, r) for c, xy, r in
+             zip(color.tolist(), ps.pos[:n].astype(np.int32).tolist(), radius.tolist())]
+    renderer.mark(rects[0].unionall(rects))
+
+
+def run_atlas(seed: int, repeat: int, renderer: str, driver: str | None) -> dict:
+    """
+    60フレームの大爆発の演出を，円を毎回描く方法と画像集から転送する方法で描いて比べる
+    引数1 seed：乱数シード
+    引数2 repeat：演出を流す回数（方法ごと）
+    引数3 renderer：描画方式
+    引数4 driver：textureで使うSDLのレンダラーのドライバ名
+    戻り値：方法ごとの1フレームの描画時間と，画像集を一から作る時間
+            （textureには画面Surfaceが無いので画像集の方だけを計る）
+    """
+    screen = pg.display.get_surface()
+    bg_img = pg.image.load(fk.asset_path("fig/pg_bg.jpg")).convert()
+    renderer = fk.make_renderer(renderer, screen, bg_img, driver)
+    start = time.perf_counter()
+    fk.ExplosionAtlas().warm_up()
+    results = {"warm_up_ms": round((time.perf_counter() - start) * 1000, 3)}
+    fk.BigExplosion.atlas.warm_up()
+    modes = [("circles", draw_circles), ("atlas", fk.BigExplosion.draw)]
+    if renderer.surface is None:
+        modes = modes[1:]
+    for mode, draw in modes:
+        times = []
+        for _ in range(repeat):
+            big = overcharge_setup(seed)[0].big_explosion
+            while big.life > 0:
+                big.step()
+                renderer.begin()
+                t = time.perf_counter()
+                draw(big, renderer)
+                times.append(time.perf_counter() - t)
+                renderer.present()
+        p50, p95 = np.percentile(np.asarray(times) * 1000, (50, 95))
+        results[mode] = {"p50_ms": round(float(p50), 4), "p95_ms": round(float(p95), 4),
+                         "mean_ms": round(float(np.mean(times)) * 1000, 4), "frames": len(times)}
+    if "circles" in results:
+        results["speedup"] = round(results["circles"]["mean_ms"] / results["atlas"]["mean_ms"], 2)
+    return results
+
+
+def main(argv: list[str] | None = None) -> dict:
+    """
+    ベンチマークのメイン処理
+    引数 argv：コマンドライン引数のリスト（Noneならsys.argv）
+    戻り値：計測結果の辞書
+    """
+    parser = argparse.ArgumentParser(description="たたかえ！こうかとん ベンチマーク")
+    parser.add_argument("--suite", choices=("frames", "alloc", "startup", "backends", "pipeline", "atlas"),
+                        default="frames",
+                        help="frames：シナリオごとのフレーム時間，alloc：定常状態のメモリ割り当て，"
+                             "startup：importと最初の画面までの時間，backends：描画方式の比較，"
+                             "pipeline：直列のループと2スレッドの比較，atlas：大爆発の描き方の比較")
+    parser.add_argument("-s", "--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="実行するシナリオ（frames専用，複数指定可，省略時は全て）")
+    parser.add_argument("--frames", type=int, default=None, help="各シナリオのフレーム数")
+    parser.add_argument("--repeat", type=int, default=5, help="startupの計測回数，atlasで演出を流す回数")
+    parser.add_argument("--seed", type=int, default=0, help="乱数シード")
+    parser.add_argument("--renderer", choices=("full", "dirty", "texture"), default="full", help="描画方式")
+    parser.add_argument("--render-driver", default="software",
+                        help="textureで使うSDLのレンダラーのドライバ名（GPUが無くても動くようにsoftwareが既定）")
+    parser.add_argument("--out", default=None, help="結果を書き出すJSONファイル（省略時は標準出力）")
+    args = parser.parse_args(argv)
+    if args.scenario and args.suite != "frames":
+        parser.error("-s/--scenario は --suite frames でしか使えない")
+
+    fk.use_dummy_video()
+    pg.init()
+    pg.display.set_mode((fk.WIDTH, fk.HEIGHT))
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "pygame": pg.version.ver,
+            "sdl": ".".join(map(str, pg.get_sdl_version())),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "renderer": args.renderer,
+            "render_driver": args.render_driver,
+        },
+        "scenarios": {},
+    }
+    if args.suite == "alloc":
+        del results["scenarios"]
+        results["alloc"] = [run_alloc(args.seed, args.frames or 1000, pooling)
+                            for pooling in (False, True)]
+        for res in results["alloc"]:
+            print(f"pooling={res['pooling']!s:>5}: gen0 {res['gc_collections_per_1000']['gen0']:.1f}"
+                  f"/1000 frames, created {res['entities_created_per_1000']:.1f}/1000 frames",
+                  file=sys.stderr)
+    if args.suite == "startup":
+        del results["scenarios"]
+        results["startup"] = run_startup(args.repeat)
+        for mode, res in results["startup"].items():
+            print(f"{mode:>10}: import {res['import_ms']:.1f} ms  first frame {res['first_frame_ms']:.1f} ms",
+                  file=sys.stderr)
+    if args.suite == "backends":
+        del results["scenarios"]
+        results["backends"] = run_backends(args.seed, args.frames, args.render_driver)
+        for name, res in results["backends"].items():
+            print(f"{name:>14}: " + "  ".join(f"{kind} p50 {res[kind]['p50_ms']:.3f} ms" for kind in BACKENDS)
+                  + f"  -> {res['winner']}", file=sys.stderr)
+    if args.suite == "pipeline":
+        del results["scenarios"]
+        results["pipeline"] = {}
+        for num_bombs in PIPELINE_BOMBS:
+            res = {mode: run_pipeline(args.seed, args.frames or 200, num_bombs, mode == "pipeline")
+                   for mode in ("serial", "pipeline")}
+            results["pipeline"][f"bombs_{num_bombs}"] = res
+            print(f"bombs_{num_bombs:>6}: serial {res['serial']['fps']:.1f} fps  "
+                  f"pipeline {res['pipeline']['fps']:.1f} fps", file=sys.stderr)
+    if args.suite == "atlas":
+        del results["scenarios"]
+        res = results["atlas"] = run_atlas(args.seed, args.repeat, args.renderer, args.render_driver)
+        line = f"overcharge draw: atlas {res['atlas']['mean_ms']:.3f} ms"
+        if "circles" in res:
+            line += f"  circles {res['circles']['mean_ms']:.3f} ms  (x{res['speedup']:.2f})"
+        print(line + f"  warm-up {res['warm_up_ms']:.1f} ms", file=sys.stderr)
+    for name in args.scenario or (SCENARIOS if args.suite == "frames" else ()):
+        results["scenarios"][name] = run_scenario(name, args.seed, args.frames, args.renderer,
+                                                  args.render_driver)
+        frame = results["scenarios"][name]["frame"]
+        print(f"{name:>14}: p50 {frame['p50_ms']:.3f} ms  p95 {frame['p95_ms']:.3f} ms  "
+              f"p99 {frame['p99_ms']:.3f} ms", file=sys.stderr)
+    pg.quit()
+
+    text = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,73 @@
+import argparse
+import json
+import logging
 import math
 import os
+import queue
 import random
+import struct
 import sys
+import threading
 import time
+import weakref
+from collections import OrderedDict, deque
+import numpy as np
 import pygame as pg
 
 
 WIDTH = 1100  # ゲームウィンドウの幅
 HEIGHT = 650  # ゲームウィンドウの高さ
 NUM_OF_BOMBS = 5  # 爆弾の数
-os.chdir(os.path.dirname(os.path.abspath(__file__)))
+CHARGE_STEP = 2  # 1フレームあたりのチャージ増加量
+MAX_BEAM_CHARGE = 150  # ビームを撃てる最大チャージ量（これを超えると大爆発）
+SCORE_BASE = 100  # 爆弾1個あたりの基本スコア
+SCORE_CHARGE_DIV = 50  # スコア倍率の分母（倍率は1 + チャージ量/この値）
+SPRITE_CACHE_ITEMS = 256  # スプライトキャッシュの最大エントリ数
+SPRITE_CACHE_BYTES = 32 * 1024 * 1024  # スプライトキャッシュのバイト予算
+BEAM_CACHE_ITEMS = 640  # ビーム画像キャッシュの最大エントリ数
+BEAM_CACHE_BYTES = 112 * 1024 * 1024  # ビーム画像キャッシュのバイト予算（8方向×76段階の全てが入る大きさ）
+TINT_STEP = 8  # チャージ中の赤みの量子化幅（0-255）
+TICK_RATE = 50  # 1秒あたりのシミュレーション更新回数（固定タイムステップ）
+MAX_FRAME_SKIP = 10  # 描画1回あたりに追いつくために進める最大のシミュレーション回数
+BEAM_POOL_SIZE = 32  # 事前に確保しておくビームの数
+EXPLOSION_POOL_SIZE = 32  # 事前に確保しておく爆発エフェクトの数
+COLLISION_CELL = 64  # 衝突判定用の格子の一辺（ピクセル，爆弾の直径以上）
+BLITS_CHUNK = 256  # 爆弾をまとめて転送するときの1回あたりの数
+PROFILE_FRAMES = 300  # プロファイラが保持する直近のフレーム数
+FRAME_BUDGET_MS = 20  # 1フレームの時間予算（50 FPS）
+TEXT_CACHE_ITEMS = 128  # 描画済み文字列キャッシュの最大エントリ数
+TEXT_CACHE_BYTES = 4 * 1024 * 1024  # 描画済み文字列キャッシュのバイト予算
+EXPLOSION_CHARGE_STEP = 10  # 爆発の画像を共有するチャージ量の量子化幅
+EXPLOSION_CACHE_ITEMS = 64  # 爆発の画像セットのキャッシュの最大エントリ数
+EXPLOSION_CACHE_BYTES = 16 * 1024 * 1024  # 爆発の画像セットのキャッシュのバイト予算
+SHOCKWAVE_STEP = 15  # 1フレームあたりの衝撃波の半径の増加量
+RING_CACHE_ITEMS = 128  # 衝撃波の輪の画像の最大数
+RING_CACHE_BYTES = 16 * 1024 * 1024  # 衝撃波の輪の画像のバイト予算
+PARTICLE_MAX_RADIUS = 15  # パーティクルの最大半径
+PARTICLE_FADE_LEVELS = 16  # パーティクルが暗くなっていく色の段階数
+QUALITY_WINDOW = 30  # 画質を決めるときに平均するフレーム数
+QUALITY_DOWN = 1.0  # 平均フレーム時間が予算のこの倍率を超えたら画質を下げる
+QUALITY_UP = 0.6  # 平均フレーム時間が予算のこの倍率を下回り続けたら画質を上げる
+QUALITY_UP_FRAMES = 150  # 画質を上げるまでに余裕のある状態が続くべきフレーム数
+TELEMETRY_QUEUE = 4096  # 書き出し待ちにできる記録の最大数（超えた分は捨てて数える）
+TELEMETRY_FILE_BYTES = 1024 * 1024  # 記録ファイル1つあたりの大きさの上限
+TELEMETRY_BACKUPS = 3  # 残しておく古い記録ファイルの数
+TELEMETRY_FLUSH_SEC = 0.5  # 書き出しのスレッドが待ち行列を見に行く間隔
+TELEMETRY_HIST_FRAMES = 250  # フレーム時間のヒストグラムを記録する間隔（フレーム数）
+TELEMETRY_HIST_BIN_MS = 2  # フレーム時間のヒストグラムの階級の幅（ミリ秒）
+TELEMETRY_HIST_BINS = 25  # フレーム時間のヒストグラムの階級の数（最後の階級はそれ以上をまとめる）
+
+log = logging.getLogger("fight_kokaton")
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__))  # 画像ファイルの置き場所の基準
+
+
+def asset_path(path: str) -> str:
+    """
+    画像ファイルなどの相対パスをこのファイルの場所を基準にした絶対パスに変換する関数
+    引数 path：このファイルからの相対パス（"fig/3.png"など）
+    戻り値：絶対パス
+    """
+    return os.path.join(ASSET_DIR, path)
 
 
 def check_bound(obj_rct: pg.Rect) -> tuple[bool, bool]:
@@ -26,6 +84,431 @@ def check_bound(obj_rct: pg.Rect) -> tuple[bool, bool]:
     return yoko, tate
 
 
+def lerp_pos(prev: tuple[int, int], rct: pg.Rect, alpha: float) -> tuple[int, int]:
+    """
+    前回の更新時の位置と現在の位置の間を補間した描画位置を返す関数
+    引数1 prev：前回の更新前の左上座標
+    引数2 rct：現在のRect
+    引数3 alpha：補間の割合（0：前回の位置，1：現在の位置）
+    戻り値：描画する左上座標
+    """
+    if alpha >= 1.0:
+        return rct.topleft
+    return (round(prev[0] + (rct.x - prev[0]) * alpha),
+            round(prev[1] + (rct.y - prev[1]) * alpha))
+
+
+def surface_bytes(surf: pg.Surface) -> int:
+    """
+    Surfaceが占有するピクセルデータのバイト数を返す関数
+    引数：対象のSurface
+    戻り値：バイト数（pitch×高さ）
+    """
+    return surf.get_pitch() * surf.get_height()
+
+
+def to_display_format(img: pg.Surface, alpha: bool = True) -> pg.Surface:
+    """
+    画面生成後であれば，画像を描画の速い画面のフォーマットに変換する関数
+    引数1 img：対象のSurface
+    引数2 alpha：透明度を残すか（Falseなら透明度の無いフォーマットにする）
+    戻り値：変換したSurface（画面がまだ無ければimgそのもの）
+    """
+    if pg.display.get_surface() is None:
+        return img
+    return img.convert_alpha() if alpha else img.convert()
+
+
+class LRUCache:
+    """
+    エントリ数とバイト予算で上限を決めるLRUキャッシュに関するクラス
+    """
+    def __init__(self, max_items: int, max_bytes: int):
+        """
+        キャッシュを初期化する
+        引数1 max_items：保持する最大エントリ数
+        引数2 max_bytes：保持する値の合計バイト数の上限
+        """
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict = OrderedDict()  # key -> (値, バイト数)
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        キーに対応する値を返し，最近使ったものとして末尾に移す
+        引数 key：キャッシュのキー
+        戻り値：値（無ければNone）
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value, nbytes: int):
+        """
+        値を登録し，上限を超えた分を古い順に追い出す
+        引数1 key：キャッシュのキー
+        引数2 value：登録する値
+        引数3 nbytes：値のバイト数
+        """
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.nbytes -= old[1]
+        self.entries[key] = (value, nbytes)
+        self.nbytes += nbytes
+        # 最新のエントリ1つは予算超過でも残す
+        while len(self.entries) > 1 and (
+                len(self.entries) > self.max_items or self.nbytes > self.max_bytes):
+            _, (_, size) = self.entries.popitem(last=False)
+            self.nbytes -= size
+            self.evictions += 1
+
+    def clear(self):
+        """
+        全エントリを破棄する（カウンタは残す）
+        """
+        self.entries.clear()
+        self.nbytes = 0
+
+    def stats(self) -> dict:
+        """
+        キャッシュの統計情報を辞書で返す
+        """
+        return {
+            "items": len(self.entries),
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class SpriteCache(LRUCache):
+    """
+    画像ファイルと変形パラメータをキーにしたスプライトキャッシュに関するクラス
+    バックグラウンドの先読みスレッドからも使えるように読み込みはロックで直列化する
+    """
+    def __init__(self, max_items: int, max_bytes: int):
+        """
+        引数1 max_items：保持するスプライトの最大数
+        引数2 max_bytes：スプライトの合計バイト数の上限
+        """
+        super().__init__(max_items, max_bytes)
+        self.lock = threading.RLock()
+
+    def load(self, path: str, angle: float = 0, scale: float = 1.0,
+             flip: tuple[bool, bool] = (False, False)) -> pg.Surface:
+        """
+        (path, angle, scale, flip)に対応するスプライトを返す
+        初回のみ画像を読み込み，flip→rotozoomの順に変形してキャッシュする
+        引数1 path：画像ファイルのパス（このファイルからの相対パス）
+        引数2 angle：回転角度（度）
+        引数3 scale：拡大率
+        引数4 flip：(左右反転, 上下反転)
+        戻り値：表示フォーマットに変換済みのSurface
+        """
+        with self.lock:
+            return self._load(path, angle, scale, flip)
+
+    def _load(self, path: str, angle: float, scale: float,
+              flip: tuple[bool, bool]) -> pg.Surface:
+        key = (path, angle, scale, flip)
+        img = self.get(key)
+        if img is not None:
+            return img
+        if key == (path, 0, 1.0, (False, False)):
+            img = pg.image.load(asset_path(path))
+        else:
+            img = self.load(path)
+            if flip != (False, False):
+                img = pg.transform.flip(img, *flip)
+            if (angle, scale) != (0, 1.0):
+                img = pg.transform.rotozoom(img, angle, scale)
+        # 画面生成後であれば描画の速いフォーマットに変換しておく
+        img = to_display_format(img)
+        self.put(key, img, surface_bytes(img))
+        return img
+
+
+# プロセス全体で共有するスプライトキャッシュ
+sprite_cache = SpriteCache(SPRITE_CACHE_ITEMS, SPRITE_CACHE_BYTES)
+
+
+class TextCache(LRUCache):
+    """
+    フォントと描画済み文字列のキャッシュに関するクラス
+    """
+    def __init__(self, max_items: int, max_bytes: int):
+        """
+        引数1 max_items：保持する描画済み文字列の最大数
+        引数2 max_bytes：描画済み文字列の合計バイト数の上限
+        """
+        super().__init__(max_items, max_bytes)
+        self.fonts: dict[tuple[str | None, int], pg.font.Font] = {}
+        self.lock = threading.RLock()  # シミュレーションのスレッドからも使うため
+
+    def font(self, name: str | None, size: int) -> pg.font.Font:
+        """
+        (name, size)に対応するフォントを返す（生成は初回のみ）
+        引数1 name：システムフォント名（Noneならpygame既定のフォント）
+        引数2 size：フォントサイズ
+        戻り値：Fontオブジェクト
+        """
+        key = (name, size)
+        # 先読みのスレッドと同時にフォントを開かない（FreeTypeの状態を共有しているため）
+        with self.lock:
+            font = self.fonts.get(key)
+            if font is None:
+                if name is None:
+                    font = pg.font.Font(None, size)
+                else:
+                    font = pg.font.SysFont(name, size)
+                self.fonts[key] = font
+        return font
+
+    def render(self, name: str | None, size: int, text: str,
+               color: tuple[int, int, int], antialias: bool = True) -> pg.Surface:
+        """
+        文字列を描画したSurfaceを返す（同じ引数なら前回の結果を使い回す）
+        引数1 name：システムフォント名（Noneならpygame既定のフォント）
+        引数2 size：フォントサイズ
+        引数3 text：描画する文字列
+        引数4 color：文字色
+        引数5 antialias：アンチエイリアスの有無
+        戻り値：文字列のSurface
+        """
+        key = (name, size, text, color, antialias)
+        with self.lock:
+            img = self.get(key)
+            if img is None:
+                img = self.font(name, size).render(text, antialias, color)
+                self.put(key, img, surface_bytes(img))
+        return img
+
+
+# プロセス全体で共有するフォント・文字列キャッシュ
+text_cache = TextCache(TEXT_CACHE_ITEMS, TEXT_CACHE_BYTES)
+
+
+class DigitText:
+    """
+    接頭辞と0～9のグリフを事前に描画しておき，並べて数値を表示するクラス
+    """
+    def __init__(self, font: pg.font.Font, color: tuple[int, int, int],
+                 prefix: str = "", antialias: bool = True):
+        """
+        グリフを描画しておく
+        引数1 font：使用するフォント
+        引数2 color：文字色
+        引数3 prefix：数値の前に付ける文字列
+        引数4 antialias：アンチエイリアスの有無
+        """
+        self.font = font
+        self.prefix_text = prefix
+        self.prefix = font.render(prefix, antialias, color)
+        self.glyphs = {ch: font.render(ch, antialias, color) for ch in "-0123456789"}
+        self.value = None
+        self.layout: list[tuple[pg.Surface, int]] = []  # (グリフ, x方向のずれ)
+
+    def draw(self, renderer: "Renderer", value: int, topleft: tuple[int, int]):
+        """
+        数値をグリフの並びとして描画する（値が変わったときだけ並びを作り直す）
+        引数1 renderer：描画先のRenderer
+        引数2 value：表示する整数
+        引数3 topleft：左上の座標
+        """
+        if value != self.value:
+            # 各グリフの位置はfont.size()で求め，まとめて描画した場合と揃える
+            self.value = value
+            text = self.prefix_text + str(value)
+            start = len(self.prefix_text)
+            self.layout = [(self.prefix, 0)]
+            for k in range(start, len(text)):
+                self.layout.append((self.glyphs[text[k]], self.font.size(text[:k])[0]))
+        left, top = topleft
+        for glyph, dx in self.layout:
+            renderer.blit(glyph, (left + dx, top))
+
+
+class Pool:
+    """
+    使い終わったエンティティを捨てずに再利用するオブジェクトプールに関するクラス
+    プールするクラスは__init__と同じ引数を取るreset()を持つこと
+    """
+    def __init__(self, cls, size: int = 0, enabled: bool = True):
+        """
+        引数1 cls：プールするクラス
+        引数2 size：最初に確保しておく数
+        引数3 enabled：Falseなら再利用せず毎回生成する（比較用）
+        """
+        self.cls = cls
+        self.enabled = enabled
+        self.free = [cls.__new__(cls) for _ in range(size)] if enabled else []
+        self.created = len(self.free)  # これまでに生成した数
+
+    def acquire(self, *args):
+        """
+        空いているオブジェクトをreset(*args)で初期化して返す（無ければ生成する）
+        """
+        if self.free:
+            obj = self.free.pop()
+            obj.reset(*args)
+            return obj
+        self.created += 1
+        return self.cls(*args)
+
+    def release(self, obj):
+        """
+        使い終わったオブジェクトをプールに戻す
+        """
+        if self.enabled:
+            self.free.append(obj)
+
+
+def swap_remove(items: list, is_alive, pool: Pool | None = None):
+    """
+    生存していない要素を末尾の要素と入れ替えて取り除く関数（リストを作り直さない）
+    要素の順序は保たれない（生成順ではなくなるので，1本のビームが複数の爆弾に
+    重なったときにどの爆弾を壊すかなど，順序に依存する処理の結果は変わりうる）
+    引数1 items：エンティティのリスト
+    引数2 is_alive：要素を受け取り生存しているかを返す関数
+    引数3 pool：取り除いた要素を戻すプール
+    """
+    i, n = 0, len(items)
+    while i < n:
+        obj = items[i]
+        if is_alive(obj):
+            i += 1
+            continue
+        n -= 1
+        items[i] = items[n]
+        items.pop()
+        if pool is not None:
+            pool.release(obj)
+
+
+def find_beam_hits(bombs: "BombSwarm", beams: list["Beam"]) -> list[tuple[int, int]]:
+    """
+    爆弾とビームの衝突の組を求める関数
+    引数1 bombs：爆弾群（rebuild()済みであること）
+    引数2 beams：ビームのリスト
+    戻り値：(爆弾の添字, ビームの添字)のリスト
+            1つのビームは1つの爆弾だけを壊し，爆弾の添字が小さい順に
+            まだ使われていない添字最小のビームを割り当てる
+    """
+    pairs = []
+    for j, beam in enumerate(beams):
+        for i in bombs.query(beam.rct).tolist():
+            pairs.append((i, j))
+    pairs.sort()
+    hits = []
+    hit_bombs, used_beams = set(), set()
+    for i, j in pairs:
+        if i not in hit_bombs and j not in used_beams:
+            hit_bombs.add(i)
+            used_beams.add(j)
+            hits.append((i, j))
+    return hits
+
+
+def tint_red(img: pg.Surface, intensity: int) -> pg.Surface:
+    """
+    画像に赤を加算した新しいSurfaceを返す関数
+    引数1 img：元の画像
+    引数2 intensity：加算する赤の強さ（0-255）
+    戻り値：赤みを付けた画像
+    """
+    tinted = img.copy()
+    red_overlay = pg.Surface(tinted.get_size())
+    red_overlay.fill((intensity, 0, 0))
+    tinted.blit(red_overlay, (0, 0), special_flags=pg.BLEND_ADD)
+    return tinted
+
+
+class BirdTints:
+    """
+    向き×赤みの段階ごとに赤く染めたこうかとん画像のテーブルに関するクラス
+    """
+    def __init__(self, step: int = TINT_STEP):
+        """
+        空のテーブルを生成する（画像は初回参照時に作る）
+        引数 step：赤みの量子化幅
+        """
+        self.step = step
+        self.table: dict[tuple[tuple[int, int], int], pg.Surface] = {}
+
+    def intensity(self, charge: int) -> int:
+        """
+        チャージ量を赤の強さに変換する（0-100を0-255に変換）
+        """
+        return min(255, int(charge * 2.55))
+
+    def get(self, dire: tuple[int, int], charge: int) -> pg.Surface:
+        """
+        向きとチャージ量に対応する赤いこうかとん画像を返す
+        引数1 dire：こうかとんの向き（Bird.sprites.imgsのキー）
+        引数2 charge：チャージ量（1以上）
+        戻り値：赤みを付けた画像
+        """
+        # 切り上げて，チャージ中は必ず少しは赤くなるようにする
+        bucket = -(-self.intensity(charge) // self.step)
+        key = (dire, bucket)
+        img = self.table.get(key)
+        if img is None:
+            img = to_display_format(tint_red(Bird.sprites.imgs[dire], min(255, bucket * self.step)))
+            self.table[key] = img
+        return img
+
+
+class BirdSprites:
+    """
+    8方向のこうかとん画像の辞書に関するクラス
+    モジュールのimport時ではなく，初めて参照されたときに画像を読み込んで回転させる
+    """
+    def __init__(self, path: str = "fig/3.png"):
+        """
+        引数 path：左向きのこうかとん画像ファイルのパス
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self._imgs: dict[tuple[int, int], pg.Surface] | None = None
+
+    @property
+    def imgs(self) -> dict[tuple[int, int], pg.Surface]:
+        """
+        向きタプルをキーにしたこうかとん画像の辞書（初回のみ生成）
+        """
+        if self._imgs is None:
+            with self.lock:
+                if self._imgs is None:
+                    self._imgs = self._make()
+        return self._imgs
+
+    def _make(self) -> dict[tuple[int, int], pg.Surface]:
+        img0 = pg.transform.rotozoom(sprite_cache.load(self.path), 0, 0.9)
+        # デフォルトのこうかとん（右向き）
+        img = pg.transform.flip(img0, True, False)
+        # 0度から反時計回りに定義
+        imgs = {
+            (+5, 0): img,  # 右
+            (+5, -5): pg.transform.rotozoom(img, 45, 0.9),  # 右上
+            (0, -5): pg.transform.rotozoom(img, 90, 0.9),  # 上
+            (-5, -5): pg.transform.rotozoom(img0, -45, 0.9),  # 左上
+            (-5, 0): img0,  # 左
+            (-5, +5): pg.transform.rotozoom(img0, 45, 0.9),  # 左下
+            (0, +5): pg.transform.rotozoom(img, -90, 0.9),  # 下
+            (+5, +5): pg.transform.rotozoom(img, -45, 0.9),  # 右下
+        }
+        return {dire: to_display_format(img) for dire, img in imgs.items()}
+
+
 class Bird:
     """
     ゲームキャラクター（こうかとん）に関するクラス
@@ -36,49 +519,37 @@ class Bird:
         pg.K_LEFT: (-5, 0),
         pg.K_RIGHT: (+5, 0),
     }
-    # 8方向のこうかとん画像の辞書
-    img0 = pg.transform.rotozoom(pg.image.load("fig/3.png"), 0, 0.9)
-    # デフォルトのこうかとん（右向き）
-    img = pg.transform.flip(img0, True, False)  
-    # 0度から反時計回りに定義
-    imgs = {  
-        (+5, 0): img,  # 右
-        (+5, -5): pg.transform.rotozoom(img, 45, 0.9),  # 右上
-        (0, -5): pg.transform.rotozoom(img, 90, 0.9),  # 上
-        (-5, -5): pg.transform.rotozoom(img0, -45, 0.9),  # 左上
-        (-5, 0): img0,  # 左
-        (-5, +5): pg.transform.rotozoom(img0, 45, 0.9),  # 左下
-        (0, +5): pg.transform.rotozoom(img, -90, 0.9),  # 下
-        (+5, +5): pg.transform.rotozoom(img, -45, 0.9),  # 右下
-    }
+    sprites = BirdSprites()  # 8方向のこうかとん画像（初回参照時に生成）
+    tints = BirdTints()  # チャージ中の赤いこうかとん画像のテーブル
 
     def __init__(self, xy: tuple[int, int]):
         """
         こうかとん画像Surfaceを生成する
         引数 xy：こうかとん画像の初期位置座標タプル
         """
-        self.img = __class__.imgs[(+5, 0)]
+        self.img = __class__.sprites.imgs[(+5, 0)]
         self.rct: pg.Rect = self.img.get_rect()
         self.rct.center = xy
+        self.prev = self.rct.topleft  # 前回の更新前の位置（描画の補間用）
         self.dire = (+5, 0)  # 向きを追加
         self.charge = 0  # チャージ量
 
-    def change_img(self, num: int, screen: pg.Surface):
+    def change_img(self, num: int, renderer: "Renderer"):
         """
         こうかとん画像を切り替え，画面に転送する
         引数1 num：こうかとん画像ファイル名の番号
-        引数2 screen：画面Surface
+        引数2 renderer：描画先のRenderer
         """
         # こうかとん画像の切り替え
-        self.img = pg.transform.rotozoom(pg.image.load(f"fig/{num}.png"), 0, 0.9)
-        screen.blit(self.img, self.rct)
+        self.img = sprite_cache.load(f"fig/{num}.png", 0, 0.9)
+        renderer.blit(self.img, self.rct)
 
-    def update(self, key_lst: list[bool], screen: pg.Surface):
+    def move(self, key_lst: list[bool]):
         """
         押下キーに応じてこうかとんを移動させる
-        引数1 key_lst：押下キーの真理値リスト
-        引数2 screen：画面Surface
+        引数 key_lst：押下キーの真理値リスト
         """
+        self.prev = self.rct.topleft
         # 移動量の合計を計算
         sum_mv = [0, 0]
         # 押下キーに応じて移動量を加算
@@ -93,88 +564,317 @@ class Bird:
             self.rct.move_ip(-sum_mv[0], -sum_mv[1])
         # 向きの更新
         if not (sum_mv[0] == 0 and sum_mv[1] == 0):
-            self.img = __class__.imgs[tuple(sum_mv)]
+            self.img = __class__.sprites.imgs[tuple(sum_mv)]
             self.dire = tuple(sum_mv)  # 向きを更新
-        
-        # チャージ中は赤くする
-        display_img = self.img.copy()
-        # チャージ量に応じて赤みを増加
-        if self.charge > 0:
-            # 0-100を0-255に変換
-            red_intensity = min(255, int(self.charge * 2.55))  
-            red_overlay = pg.Surface(display_img.get_size())
-            red_overlay.fill((red_intensity, 0, 0))
-            display_img.blit(red_overlay, (0, 0), special_flags=pg.BLEND_ADD)
-        # 画面に転送
-        screen.blit(display_img, self.rct)
+
+    def draw(self, renderer: "Renderer", alpha: float = 1.0):
+        """
+        こうかとんを画面に転送する（チャージ中は赤くする）
+        引数1 renderer：描画先のRenderer
+        引数2 alpha：前回の更新からの補間の割合
+        """
+        pos = lerp_pos(self.prev, self.rct, alpha)
+        if self.charge == 0:
+            # チャージしていなければそのまま転送
+            renderer.blit(self.img, pos)
+        elif self.img is __class__.sprites.imgs.get(self.dire):
+            # チャージ量に応じて赤みを増加（事前に作った画像を使う）
+            renderer.blit(__class__.tints.get(self.dire, self.charge), pos)
+        else:
+            # change_imgで差し替えた画像はテーブルに無いのでその場で染める
+            tinted = tint_red(self.img, __class__.tints.intensity(self.charge))
+            renderer.blit(tinted, pos)
+
+
+class BeamSprites(LRUCache):
+    """
+    向き×チャージ段階ごとに回転・拡大済みのビーム画像のキャッシュに関するクラス
+    全ての段階を持つと100MBを超えるので，バイト予算を超えたら古いものから追い出す
+    """
+    def __init__(self, path: str = "fig/beam.png", step: int = CHARGE_STEP,
+                 max_charge: int = MAX_BEAM_CHARGE, max_items: int = BEAM_CACHE_ITEMS,
+                 max_bytes: int = BEAM_CACHE_BYTES):
+        """
+        空のキャッシュを生成する（画像は初回参照時に作る）
+        引数1 path：ビーム画像ファイルのパス
+        引数2 step：チャージ量の量子化幅
+        引数3 max_charge：キャッシュに載せる最大チャージ量
+        引数4 max_items：保持する画像の最大数
+        引数5 max_bytes：画像の合計バイト数の上限
+        """
+        super().__init__(max_items, max_bytes)
+        self.path = path
+        self.step = step
+        self.max_charge = max_charge
+        self.lock = threading.Lock()  # 先読みのスレッドがwarm_upで埋めている間も使うため
+
+    def bucket(self, charge: int) -> int:
+        """
+        チャージ量をテーブルの段階番号に変換する
+        引数 charge：チャージ量
+        戻り値：段階番号
+        """
+        return max(0, min(charge, self.max_charge)) // self.step
+
+    def get_image(self, dire: tuple[int, int], charge: int) -> pg.Surface:
+        """
+        向きとチャージ量に対応するビーム画像を返す
+        引数1 dire：ビームの向き（Bird.sprites.imgsのキー）
+        引数2 charge：チャージ量
+        戻り値：ビーム画像Surface
+        """
+        key = (dire, self.bucket(charge))
+        with self.lock:
+            img = self.get(key)
+            if img is None:
+                img = self._make(*key)
+                self.put(key, img, surface_bytes(img))
+        return img
+
+    def _make(self, dire: tuple[int, int], bucket: int) -> pg.Surface:
+        """
+        テーブルの1エントリを生成する
+        """
+        # チャージ量に応じてサイズを変更（1.0倍～5.0倍）
+        scale = 1.0 + (bucket * self.step / 100) * 4.0
+        angle = math.degrees(math.atan2(-dire[1], dire[0]))
+        return to_display_format(pg.transform.rotozoom(sprite_cache.load(self.path), angle, scale))
+
+    def warm_up(self, dires) -> None:
+        """
+        向き×チャージ段階の画像を，生成に時間のかかるチャージの大きい順に事前に生成する
+        （予算に収まらない画像は登録しない．作った画像を追い出すことはない）
+        引数 dires：向きタプルのイテラブル
+        """
+        dires = list(dires)
+        for bucket in range(self.max_charge // self.step, -1, -1):
+            for dire in dires:
+                key = (dire, bucket)
+                with self.lock:
+                    if key in self.entries:
+                        continue
+                    img = self._make(*key)
+                    size = surface_bytes(img)
+                    if len(self.entries) >= self.max_items or self.nbytes + size > self.max_bytes:
+                        return
+                    self.put(key, img, size)
 
 
 class Beam:
     """
     こうかとんが放つビームに関するクラス
     """
+    __slots__ = ("charge", "vx", "vy", "img", "rct", "prev", "alive")
+    sprites = BeamSprites()  # 全ビームで共有する画像テーブル
+
     def __init__(self, bird: "Bird", charge: int):
         """
         ビーム画像Surfaceを生成する
         引数1 bird：ビームを放つこうかとん（Birdインスタンス）
         引数2 charge：チャージ量（0-150）
         """
+        self.reset(bird, charge)
+
+    def reset(self, bird: "Bird", charge: int):
+        """
+        ビームを（再）初期化する（プールから再利用するときに呼ばれる）
+        引数1 bird：ビームを放つこうかとん（Birdインスタンス）
+        引数2 charge：チャージ量（0-150）
+        """
+        self.alive = True  # 爆弾に当たったらFalse
         self.charge = charge
         self.vx, self.vy = bird.dire  # こうかとんの向き
         
-        # チャージ量に応じてサイズを変更（1.0倍～5.0倍）
-        scale = 1.0 + (charge / 100) * 4.0
-        angle = math.degrees(math.atan2(-self.vy, self.vx))
-        self.img = pg.transform.rotozoom(pg.image.load("fig/beam.png"), angle, scale)
+        # チャージ量・向きに応じた画像をテーブルから取得
+        self.img = __class__.sprites.get_image(bird.dire, charge)
         self.rct = self.img.get_rect()
         
         # 向きに応じた初期位置
         self.rct.centerx = bird.rct.centerx + bird.rct.width * self.vx // 5
         self.rct.centery = bird.rct.centery + bird.rct.height * self.vy // 5
+        self.prev = self.rct.topleft  # 前回の更新前の位置（描画の補間用）
         
         # 速度もチャージに応じて増加
         speed_multiplier = 1.0 + (charge / 100) * 2.0
         self.vx = int(self.vx * speed_multiplier)
         self.vy = int(self.vy * speed_multiplier)
 
-    def update(self, screen: pg.Surface):
+    def move(self):
         """
         ビームを速度ベクトルself.vx, self.vyに基づき移動させる
-        引数 screen：画面Surface
         """
+        self.prev = self.rct.topleft
         self.rct.move_ip(self.vx, self.vy)
-        screen.blit(self.img, self.rct)
+
+    def is_alive(self) -> bool:
+        """
+        爆弾に当たっておらず画面内にあるか
+        """
+        return self.alive and check_bound(self.rct) == (True, True)
+
+    def draw(self, renderer: "Renderer", alpha: float = 1.0):
+        """
+        ビームを画面に転送する
+        引数1 renderer：描画先のRenderer
+        引数2 alpha：前回の更新からの補間の割合
+        """
+        renderer.blit(self.img, lerp_pos(self.prev, self.rct, alpha))
 
 
-class Bomb:
+class BombSwarm:
     """
-    爆弾に関するクラス
+    全ての爆弾の位置・速度をNumPy配列でまとめて持つ爆弾群に関するクラス
+    1枚の爆弾画像を全ての爆弾で共有し，移動（壁での跳ね返り）と描画を一括で行う
     """
-    def __init__(self, color: tuple[int, int, int], rad: int):
+    def __init__(self, num: int, color: tuple[int, int, int] = (255, 0, 0), rad: int = 10,
+                 rng: random.Random = random):
         """
-        引数に基づき爆弾円Surfaceを生成する
-        引数1 color：爆弾円の色タプル
-        引数2 rad：爆弾円の半径
+        引数に基づき爆弾円Surfaceとnum個の爆弾を生成する
+        引数1 num：爆弾の数
+        引数2 color：爆弾円の色タプル
+        引数3 rad：爆弾円の半径
+        引数4 rng：初期位置を決める乱数生成器（既定はrandomモジュール）
         """
         self.img = pg.Surface((2*rad, 2*rad))
         pg.draw.circle(self.img, color, (rad, rad), rad)
-        self.img.set_colorkey((0, 0, 0))
-        self.rct = self.img.get_rect()
-        self.rct.center = random.randint(0, WIDTH), random.randint(0, HEIGHT)
-        self.vx, self.vy = +5, +5
+        self.img.set_colorkey((0, 0, 0), pg.RLEACCEL)  # 透過色の転送を速くする
+        self.w, self.h = self.img.get_size()
+        self.n = num  # 残っている爆弾の数（配列の先頭n個が有効）
+        centers = [(rng.randint(0, WIDTH), rng.randint(0, HEIGHT)) for _ in range(num)]
+        # 左上座標
+        self.pos = np.array(centers, dtype=np.int64).reshape(num, 2) - (self.w // 2, self.h // 2)
+        self.prev = self.pos.copy()  # 前回の更新前の位置（描画の補間用）
+        self.vel = np.full((num, 2), 5, dtype=np.int64)
+        self.alive = np.ones(num, dtype=bool)  # ビームに当たったらFalse
+        self.dead = 0  # 壊れたがまだ取り除いていない爆弾の数
+        # 衝突判定用の格子：左上座標の属する格子のキーで並べた添字とそのキー
+        self.cell = COLLISION_CELL
+        self.order = np.arange(0)
+        self.keys = np.arange(0)
+
+    def __len__(self) -> int:
+        return self.n
 
-    def update(self, screen: pg.Surface):
+    def rect(self, i: int) -> pg.Rect:
         """
-        爆弾を速度ベクトルself.vx, self.vyに基づき移動させる
-        引数 screen：画面Surface
+        i番目の爆弾のRectを返す
         """
-        yoko, tate = check_bound(self.rct)
-        if not yoko:
-            self.vx *= -1
-        if not tate:
-            self.vy *= -1
-        self.rct.move_ip(self.vx, self.vy)
-        screen.blit(self.img, self.rct)
+        x, y = self.pos[i].tolist()
+        return pg.Rect(x, y, self.w, self.h)
+
+    def center(self, i: int) -> tuple[int, int]:
+        """
+        i番目の爆弾の中心座標を返す
+        """
+        x, y = self.pos[i].tolist()
+        return x + self.w // 2, y + self.h // 2
+
+    def move(self):
+        """
+        全ての爆弾を速度ベクトルに基づき移動させる
+        check_boundと同じく，移動前に画面からはみ出していた向きの速度を反転する
+        """
+        n = self.n
+        pos, vel = self.pos[:n], self.vel[:n]
+        self.prev[:n] = pos
+        x, y = pos[:, 0], pos[:, 1]
+        out_x = (x < 0) | (WIDTH < x + self.w)
+        out_y = (y < 0) | (HEIGHT < y + self.h)
+        np.negative(vel[:, 0], out=vel[:, 0], where=out_x)
+        np.negative(vel[:, 1], out=vel[:, 1], where=out_y)
+        pos += vel
+
+    # 格子のキー（列番号 * CELL_STRIDE + 行番号，同じ列の格子は行番号の順に並ぶ）
+    CELL_STRIDE = 1 << 32
+
+    def rebuild(self):
+        """
+        衝突判定の準備として爆弾を格子に振り分ける（移動したら判定の前に呼ぶ）
+        各爆弾の左上座標の属する格子のキーを求め，キーの順に並べておく
+        """
+        cells = self.pos[:self.n] // self.cell
+        keys = cells[:, 0] * __class__.CELL_STRIDE + cells[:, 1]
+        self.order = np.argsort(keys, kind="stable")
+        self.keys = keys[self.order]
+
+    def query(self, rct: pg.Rect) -> np.ndarray:
+        """
+        Rectと重なる爆弾の添字を返す（壊れた爆弾も含む）
+        引数 rct：問い合わせるRect
+        戻り値：添字の配列（昇順）
+        """
+        # 左上がこの範囲の格子にある爆弾だけがRectと重なりうる（爆弾は格子より小さい）
+        cell, stride = self.cell, __class__.CELL_STRIDE
+        cx0, cx1 = (rct.left - self.w + 1) // cell, (rct.right - 1) // cell
+        cy0, cy1 = (rct.top - self.h + 1) // cell, (rct.bottom - 1) // cell
+        # 列ごとに，行cy0からcy1までの格子は並べたキーの連続した区間になる
+        cols = np.arange(cx0, cx1 + 1) * stride
+        lo = np.searchsorted(self.keys, cols + cy0, "left").tolist()
+        hi = np.searchsorted(self.keys, cols + cy1, "right").tolist()
+        spans = [self.order[a:b] for a, b in zip(lo, hi) if a < b]
+        if not spans:
+            return self.order[:0]
+        found = np.concatenate(spans)
+        x, y = self.pos[found, 0], self.pos[found, 1]
+        found = found[(x < rct.right) & (rct.left < x + self.w) & (y < rct.bottom) & (rct.top < y + self.h)]
+        found.sort()
+        return found
+
+    def collides(self, rct: pg.Rect) -> bool:
+        """
+        壊れていない爆弾のどれかがRectと重なっているか
+        引数 rct：判定するRect
+        """
+        n = self.n
+        x, y = self.pos[:n, 0], self.pos[:n, 1]
+        hit = (x < rct.right) & (rct.left < x + self.w) & (y < rct.bottom) & (rct.top < y + self.h)
+        return bool((hit & self.alive[:n]).any())
+
+    def destroy(self, i: int):
+        """
+        i番目の爆弾を壊す（配列から取り除くのはcompact()のとき）
+        """
+        if self.alive[i]:
+            self.alive[i] = False
+            self.dead += 1
+
+    def compact(self):
+        """
+        壊れた爆弾を末尾の爆弾と入れ替えて取り除く（swap_removeと同じ順序になる）
+        """
+        if self.dead == 0:
+            return
+        n = self.n
+        dead = np.flatnonzero(~self.alive[:n]).tolist()
+        dead_set = set(dead)
+        k = 0
+        while k < len(dead) and dead[k] < n:
+            i = dead[k]
+            n -= 1
+            if n != i:
+                for arr in (self.pos, self.prev, self.vel):
+                    arr[i] = arr[n]
+                if n in dead_set:
+                    continue  # 移してきた爆弾も壊れているので同じ場所をもう一度調べる
+            k += 1
+        self.n = n
+        self.alive[:n] = True
+        self.dead = 0
+
+    def draw(self, renderer: "Renderer", alpha: float = 1.0):
+        """
+        全ての爆弾を1回のblitsで画面に転送する
+        引数1 renderer：描画先のRenderer
+        引数2 alpha：前回の更新からの補間の割合
+        """
+        pos = self.pos[:self.n]
+        if alpha < 1.0:
+            prev = self.prev[:self.n]
+            pos = np.round(prev + (pos - prev) * alpha).astype(np.int64)
+        img = self.img
+        # 一度に全ての座標のリストを作るとGCが頻繁に走るので，少しずつ作って転送する
+        for k in range(0, len(pos), BLITS_CHUNK):
+            renderer.blits([(img, xy) for xy in pos[k:k + BLITS_CHUNK].tolist()])
 
 
 class Score:
@@ -185,173 +885,429 @@ class Score:
         """
         スコアの初期化
         """
-        self.fonto = pg.font.SysFont("hgp創英角ポップ体", 30)
+        self.fonto = text_cache.font("hgp創英角ポップ体", 30)
         self.color = (0, 0, 255)
         self.score = 0
-        self.img = self.fonto.render(f"Score: {self.score}", 0, self.color)
+        self.img = text_cache.render("hgp創英角ポップ体", 30, f"Score: {self.score}", self.color, False)
         self.rct = self.img.get_rect()
         self.rct.center = (100, HEIGHT - 50)
+        # 数字は事前に描画したグリフを並べて表示する
+        self.digits = DigitText(self.fonto, self.color, "Score: ", False)
     
-    def update(self, screen: pg.Surface):
+    def draw(self, renderer: "Renderer"):
         """
         スコアを画面に表示
-        引数 screen：画面Surface
+        引数 renderer：描画先のRenderer
         """
-        self.img = self.fonto.render(f"Score: {self.score}", 0, self.color)
-        screen.blit(self.img, self.rct)
+        self.digits.draw(renderer, self.score, self.rct.topleft)
 
 
-class Particle:
+class QualityLevel:
     """
-    爆発パーティクルに関するクラス
+    演出の画質の段階に関するクラス
     """
-    def __init__(self, x: int, y: int, vx: float, vy: float, color: tuple[int, int, int], size: int, life: int):
+    def __init__(self, name: str, particles: float, rings: int, explosion_step: int,
+                 explosion_max_charge: int, life: float):
         """
-        パーティクルの初期化
-        引数1 x：初期x座標
-        引数2 y：初期y座標
-        引数3 vx：x方向の速度
-        引数4 vy：y方向の速度
-        引数5 color：パーティクルの色
-        引数6 size：パーティクルのサイズ
-        引数7 life：パーティクルの寿命
+        引数1 name：段階の名前
+        引数2 particles：大爆発のパーティクル数の倍率
+        引数3 rings：大爆発の衝撃波の輪の数
+        引数4 explosion_step：爆発の画像の大きさを決めるチャージ量の量子化幅
+        引数5 explosion_max_charge：爆発の画像の大きさに使うチャージ量の上限
+        引数6 life：爆発とパーティクルの表示時間の倍率
         """
-        self.x = x
-        self.y = y
-        self.vx = vx
-        self.vy = vy
-        self.color = color
-        self.size = size
+        self.name = name
+        self.particles = particles
+        self.rings = rings
+        self.explosion_step = explosion_step
+        self.explosion_max_charge = explosion_max_charge
         self.life = life
-        self.max_life = life
-    
-    def update(self, screen: pg.Surface):
+
+    def explosion_charge(self, charge: int) -> int:
         """
-        パーティクルを更新して描画
-        引数 screen：画面Surface
+        爆発の画像の大きさを決めるチャージ量を返す（段階に応じて粗くし，上限で抑える）
         """
-        self.life -= 1
-        if self.life > 0:
-            # 重力効果
-            self.vy += 0.3
-            self.x += self.vx
-            self.y += self.vy
-            
-            # フェードアウト効果
-            current_size = max(1, int(self.size * (self.life / self.max_life)))
-            
-            # 色を徐々に暗くする
-            fade_color = tuple(int(c * (self.life / self.max_life)) for c in self.color)
-            
-            # 描画
-            pg.draw.circle(screen, fade_color, (int(self.x), int(self.y)), current_size)
+        return min(charge, self.explosion_max_charge) // self.explosion_step * self.explosion_step
+
+    def scale_life(self, life: int) -> int:
+        """
+        表示時間を段階に応じて短くする（最低1フレーム）
+        """
+        return max(1, int(life * self.life))
+
+
+# 画質の段階（先頭が最高画質）
+QUALITY_LEVELS = (
+    QualityLevel("high", 1.0, 3, EXPLOSION_CHARGE_STEP, MAX_BEAM_CHARGE, 1.0),
+    QualityLevel("medium", 0.6, 2, 30, 100, 0.8),
+    QualityLevel("low", 0.3, 1, 50, 50, 0.6),
+    QualityLevel("minimal", 0.1, 1, 50, 0, 0.4),
+)
+
+
+# 大爆発の色バリエーション
+EXPLOSION_COLORS = (
+    (255, 100, 0),   # オレンジ
+    (255, 50, 0),    # 赤オレンジ
+    (255, 200, 0),   # 黄色
+    (255, 0, 0),     # 赤
+    (255, 150, 50),  # 明るいオレンジ
+)
+
+
+class ExplosionAtlas:
+    """
+    大爆発の衝撃波の輪とパーティクルの円を前もって描いておく画像集に関するクラス
+    パーティクルの円は（半径, 暗さの段階, 色）の組み合わせごとに初めて使うときに描いて表に残し，
+    衝撃波の輪は（半径, 何番目の輪か）ごとに初回に描いてキャッシュする
+    描画時は円を描かずに画像をまとめて転送するだけになる
+    """
+    def __init__(self, palette=EXPLOSION_COLORS, levels: int = PARTICLE_FADE_LEVELS,
+                 max_radius: int = PARTICLE_MAX_RADIUS):
+        """
+        引数1 palette：パーティクルの色のタプル
+        引数2 levels：パーティクルが暗くなっていく色の段階数
+        引数3 max_radius：パーティクルの最大半径
+        """
+        self.palette = tuple(palette)
+        self.levels = levels
+        self.max_radius = max_radius
+        size = max_radius * levels * len(self.palette)
+        self.discs: list[pg.Surface | None] = [None] * size
+        self.drawn = np.zeros(size, dtype=bool)  # 円の表のどこまで描いたか
+        self.rings = LRUCache(RING_CACHE_ITEMS, RING_CACHE_BYTES)
+        self.lock = threading.Lock()  # 先読みスレッドと共有するため
+
+    @staticmethod
+    def _circle(color, radius: int, width: int = 0) -> pg.Surface:
+        """
+        黒を透明色にしたSurfaceの中央に円を描く（中心を(radius, radius)にして描くので，
+        中心から半径だけずらして転送すればpg.draw.circleで直接描いたのと同じ画素になる）
+        """
+        img = pg.Surface((2 * radius, 2 * radius))
+        pg.draw.circle(img, color, (radius, radius), radius, width)
+        img = to_display_format(img, alpha=False)
+        img.set_colorkey((0, 0, 0), pg.RLEACCEL)
+        return img
+
+    def disc_table(self, keys: np.ndarray | None = None) -> list[pg.Surface | None]:
+        """
+        パーティクルの円の表を返す（keysの円のうち，まだ描いていないものだけ描き足す）
+        (半径r, 段階lv, 色p)の円は ((r-1)*levels + lv-1)*len(palette) + p 番目にある
+        引数1 keys：使う円の添字の配列（Noneなら全て）
+        戻り値：円の表（keysにない円はNoneのことがある）
+        """
+        if keys is None:
+            keys = np.arange(len(self.discs))
+        if self.drawn[keys].all():
+            return self.discs
+        with self.lock:
+            missing = np.unique(keys[~self.drawn[keys]])
+            per_radius = self.levels * len(self.palette)
+            for key in missing.tolist():
+                r, rest = divmod(key, per_radius)
+                lv, p = divmod(rest, len(self.palette))
+                color = tuple(c * (lv + 1) // self.levels for c in self.palette[p])
+                self.discs[key] = self._circle(color, r + 1)
+            self.drawn[missing] = True
+        return self.discs
+
+    def disc_keys(self, radius: np.ndarray, level: np.ndarray, shade: np.ndarray) -> np.ndarray:
+        """
+        半径・段階・色の番号の配列から，円の表の添字の配列を求める
+        """
+        return ((radius - 1) * self.levels + level - 1) * len(self.palette) + shade
+
+    def ring(self, radius: int, index: int) -> pg.Surface:
+        """
+        index番目（0始まり，外側から）の衝撃波の輪の画像を返す
+        引数1 radius：輪の半径
+        引数2 index：何番目の輪か（色と太さが決まる）
+        """
+        key = (radius, index)
+        with self.lock:
+            img = self.rings.get(key)
+            if img is None:
+                img = self._circle((255, 200 - index * 50, 0), radius, max(1, 5 - index))
+                self.rings.put(key, img, surface_bytes(img))
+        return img
+
+    def warm_up(self, rings: int = 3, max_radius: int = 200 + SHOCKWAVE_STEP):
+        """
+        既定のルールの大爆発で使う輪と円を全て描いておく
+        引数1 rings：輪の数
+        引数2 max_radius：輪の最大半径
+        """
+        self.disc_table()
+        for radius in range(SHOCKWAVE_STEP, max_radius + 1, SHOCKWAVE_STEP):
+            for i in range(rings):
+                if radius - i * 20 > 0:
+                    self.ring(radius - i * 20, i)
+
+
+class ParticleSystem:
+    """
+    位置・速度・寿命・サイズ・色の番号をNumPy配列（構造体の配列ではなく配列の構造体）で
+    まとめて持つパーティクル群に関するクラス
+    """
+    gravity = 0.3  # 1フレームあたりの重力加速度
+
+    def __init__(self, atlas: ExplosionAtlas, capacity: int = 256):
+        """
+        空のパーティクル群を生成する
+        引数1 atlas：パーティクルの円の画像集（色はこのpaletteから選ぶ）
+        引数2 capacity：最初に確保しておくパーティクル数
+        """
+        self.atlas = atlas
+        self.n = 0  # 生存しているパーティクル数（配列の先頭n個が有効）
+        self.pos = np.zeros((capacity, 2))
+        self.vel = np.zeros((capacity, 2))
+        self.life = np.zeros(capacity, dtype=np.int32)
+        self.max_life = np.ones(capacity, dtype=np.int32)
+        self.size = np.zeros(capacity, dtype=np.int32)
+        self.shade = np.zeros(capacity, dtype=np.int32)  # atlas.paletteの何番目の色か
+
+    def __len__(self) -> int:
+        return self.n
+
+    def _reserve(self, count: int):
+        """
+        count個追加できるように配列を拡張する（容量は倍々で増やす）
+        """
+        capacity = len(self.life)
+        if self.n + count <= capacity:
+            return
+        while capacity < self.n + count:
+            capacity *= 2
+        for name in ("pos", "vel", "life", "max_life", "size", "shade"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.n] = old[:self.n]
+            setattr(self, name, new)
+
+    def emit(self, center: tuple[int, int], count: int, rng: "np.random.Generator",
+             speed: tuple[float, float] = (5, 20),
+             size: tuple[int, int] = (5, PARTICLE_MAX_RADIUS), life: tuple[int, int] = (40, 70)):
+        """
+        中心から放射状にパーティクルをまとめて生成する（色はatlas.paletteから選ぶ）
+        引数1 center：放出する中心座標
+        引数2 count：生成するパーティクル数
+        引数3 rng：乱数生成器
+        引数4 speed：初速の範囲（最小, 最大）
+        引数5 size：サイズの範囲（両端を含む，最大はatlasの最大半径まで）
+        引数6 life：寿命の範囲（両端を含む）
+        """
+        if count <= 0:
+            return
+        self._reserve(count)
+        sl = slice(self.n, self.n + count)
+        angle = rng.uniform(0, 2 * math.pi, count)
+        spd = rng.uniform(speed[0], speed[1], count)
+        self.pos[sl] = center
+        self.vel[sl, 0] = np.cos(angle) * spd
+        self.vel[sl, 1] = np.sin(angle) * spd
+        self.shade[sl] = rng.integers(0, len(self.atlas.palette), count)
+        self.size[sl] = rng.integers(size[0], size[1] + 1, count)
+        self.life[sl] = self.max_life[sl] = rng.integers(life[0], life[1] + 1, count)
+        self.n += count
+
+    def step(self):
+        """
+        寿命を減らして死んだパーティクルを取り除き，重力と移動を一括で適用する
+        """
+        n = self.n
+        self.life[:n] -= 1
+        alive = self.life[:n] > 0
+        if not alive.all():
+            # 生存しているものだけを先頭に詰める
+            keep = np.flatnonzero(alive)
+            self.n = n = len(keep)
+            for arr in (self.pos, self.vel, self.life, self.max_life, self.size, self.shade):
+                arr[:n] = arr[keep]
+        self.vel[:n, 1] += self.gravity
+        self.pos[:n] += self.vel[:n]
+
+    def draw(self, renderer: "Renderer", alpha: float = 1.0):
+        """
+        寿命に応じて縮小・暗転させたパーティクルを描画する
+        引数1 renderer：描画先のRenderer
+        引数2 alpha：前回の更新からの補間の割合
+        """
+        n = self.n
+        if n == 0:
+            return
+        atlas = self.atlas
+        life, max_life = self.life[:n], self.max_life[:n]
+        # フェードアウト効果（サイズと色を寿命の割合で小さく・暗くする）
+        # 色は寿命の割合をlevels段階に切り上げた暗さの円を画像集から選ぶ
+        radius = np.clip((self.size[:n] * (life / max_life)).astype(np.int32), 1, atlas.max_radius)
+        level = (life * atlas.levels + max_life - 1) // max_life
+        keys = atlas.disc_keys(radius, level, self.shade[:n])
+        if alpha >= 1.0:
+            centers = self.pos[:n].astype(np.int32)
+        else:
+            # 直前の移動量だけ戻した位置から補間する
+            centers = (self.pos[:n] - self.vel[:n] * (1.0 - alpha)).astype(np.int32)
+        topleft = centers - radius[:, None]
+        renderer.blits(list(zip(map(atlas.disc_table(keys).__getitem__, keys.tolist()), topleft.tolist())))
 
 
 class BigExplosion:
     """
     オーバーチャージ時の大爆発に関するクラス
     """
-    def __init__(self, center: tuple[int, int], charge: int):
+    atlas = ExplosionAtlas()  # 全ての大爆発で共有する輪と円の画像集
+
+    def __init__(self, center: tuple[int, int], charge: int, rng: random.Random = random,
+                 quality: QualityLevel = QUALITY_LEVELS[0]):
         """
         大爆発の初期化
         引数1 center：爆発の中心座標
         引数2 charge：チャージ量
+        引数3 rng：パーティクルの乱数シードを引く乱数生成器
+        引数4 quality：画質の段階（パーティクル数・寿命・衝撃波の輪の数を変える）
         """
-        self.particles = []
+        self.particles = ParticleSystem(__class__.atlas)
         self.center = center
+        # 演出の長さは画質によらず同じ（シミュレーションのフレーム数を変えないため）
         self.life = 60
-        
+        self.rings = quality.rings
+
         # チャージ量に応じてパーティクル数を増やす
-        num_particles = int(100 + (charge - 150) * 2)
+        num_particles = int((100 + (charge - 150) * 2) * quality.particles)
         
-        # 爆発の色バリエーション
-        colors = [
-            (255, 100, 0),   # オレンジ
-            (255, 50, 0),    # 赤オレンジ
-            (255, 200, 0),   # 黄色
-            (255, 0, 0),     # 赤
-            (255, 150, 50),  # 明るいオレンジ
-        ]
-        
-        # パーティクルを放射状に生成
-        for _ in range(num_particles):
-            angle = random.uniform(0, 2 * math.pi)
-            speed = random.uniform(5, 20)
-            vx = math.cos(angle) * speed
-            vy = math.sin(angle) * speed
-            color = random.choice(colors)
-            size = random.randint(5, 15)
-            life = random.randint(40, 70)
-            # パーティクルを追加
-            self.particles.append(Particle(center[0], center[1], vx, vy, color, size, life))
+        # パーティクルを放射状に生成（乱数はrngのシードに従う，色はEXPLOSION_COLORSから選ぶ）
+        np_rng = np.random.default_rng(rng.getrandbits(32))
+        self.particles.emit(center, num_particles, np_rng,
+                            life=(quality.scale_life(40), quality.scale_life(70)))
         
         # 衝撃波用の円
         self.shockwave_radius = 0
         self.shockwave_max = 200 + (charge - 150)
     
-    def update(self, screen: pg.Surface):
+    def step(self):
         """
-        爆発エフェクトを更新
-        引数 screen：画面Surface
+        爆発エフェクトを1フレーム進める
         """
         # 爆発の寿命を減少
         self.life -= 1
-        
-        # 衝撃波の描画
         if self.shockwave_radius < self.shockwave_max:
             # 衝撃波の半径を増加
-            self.shockwave_radius += 15
-            alpha = int(255 * (1 - self.shockwave_radius / self.shockwave_max))
-            if alpha > 0:
-                # 複数の衝撃波の輪を描画
-                for i in range(3):
-                    radius = self.shockwave_radius - i * 20
-                    # 輪の透明度を設定
-                    if radius > 0:
-                        thickness = max(1, 5 - i)
-                        pg.draw.circle(screen, (255, 200 - i * 50, 0), self.center, int(radius), thickness)
-        
+            self.shockwave_radius += SHOCKWAVE_STEP
         # パーティクルの更新
-        self.particles = [p for p in self.particles if p.life > 0]
-        for particle in self.particles:
-            particle.update(screen)
+        self.particles.step()
+
+    def draw(self, renderer: "Renderer", alpha: float = 1.0):
+        """
+        爆発エフェクトを描画
+        引数1 renderer：描画先のRenderer
+        引数2 alpha：前回の更新からの補間の割合（パーティクルに使う）
+        """
+        # 衝撃波の描画（最大半径に近づくほど薄れ，消えたら描かない）
+        fade = int(255 * (1 - self.shockwave_radius / self.shockwave_max))
+        if self.shockwave_radius > 0 and fade > 0:
+            # 複数の衝撃波の輪を画像集から転送する
+            cx, cy = self.center
+            seq = []
+            for i in range(self.rings):
+                radius = self.shockwave_radius - i * 20
+                if radius > 0:
+                    seq.append((__class__.atlas.ring(radius, i), (cx - radius, cy - radius)))
+            renderer.blits(seq)
+        self.particles.draw(renderer, alpha)
 
 
-class Explosion:
+class ExplosionFrames(LRUCache):
     """
-    爆発エフェクトに関するクラス
+    チャージ段階ごとの爆発の画像セット（反転した4枚）を全ての爆発で共有するキャッシュに関するクラス
     """
-    def __init__(self, bomb: Bomb, charge: int = 0):
+    def __init__(self, max_items: int = EXPLOSION_CACHE_ITEMS, max_bytes: int = EXPLOSION_CACHE_BYTES,
+                 path: str = "fig/explosion.gif", step: int = EXPLOSION_CHARGE_STEP):
         """
-        爆発エフェクトの初期化
-        引数1 bomb：爆発する爆弾
-        引数2 charge：チャージ量
+        引数1 max_items：保持する画像セットの最大数
+        引数2 max_bytes：画像セットの合計バイト数の上限（超えたら古いものから追い出す）
+        引数3 path：爆発画像ファイルのパス
+        引数4 step：チャージ量の量子化幅
         """
-        # 通常の爆発（gifベース）
-        img = pg.image.load("fig/explosion.gif")
-        scale = 1.0 + (charge / 100) * 2.0
-        # 4方向の画像を用意_flipを活用
-        self.imgs = [
-            pg.transform.rotozoom(img, 0, scale),
-            pg.transform.rotozoom(pg.transform.flip(img, True, False), 0, scale),
-            pg.transform.rotozoom(pg.transform.flip(img, False, True), 0, scale),
-            pg.transform.rotozoom(pg.transform.flip(img, True, True), 0, scale)
-        ]
-        self.life = 20
-        # 最初の画像
-        self.img = self.imgs[0]
-        self.rct = self.img.get_rect()
-        self.rct.center = bomb.rct.center if hasattr(bomb, 'rct') else bomb
-    
-    def update(self, screen: pg.Surface):
+        super().__init__(max_items, max_bytes)
+        self.path = path
+        self.step = step
+        self.lock = threading.Lock()  # 先読みスレッドと共有するため
+
+    def get_frames(self, charge: int) -> tuple[pg.Surface, ...]:
         """
-        爆発エフェクトを表示
-        引数 screen：画面Surface
+        チャージ量に対応する画像セットを返す（無ければ生成してキャッシュする）
+        引数 charge：チャージ量
+        戻り値：(そのまま, 左右反転, 上下反転, 上下左右反転)の4枚
+        """
+        bucket = max(0, charge) // self.step
+        with self.lock:
+            frames = self.get(bucket)
+            if frames is None:
+                frames = self._make(bucket)
+                self.put(bucket, frames, sum(surface_bytes(img) for img in frames))
+        return frames
+
+    def _make(self, bucket: int) -> tuple[pg.Surface, ...]:
+        img = sprite_cache.load(self.path)
+        scale = 1.0 + (bucket * self.step / 100) * 2.0
+        # 4方向の画像を用意_flipを活用
+        frames = tuple(
+            pg.transform.rotozoom(pg.transform.flip(img, *flip), 0, scale)
+            for flip in ((False, False), (True, False), (False, True), (True, True))
+        )
+        return tuple(to_display_format(img) for img in frames)
+
+
+class Explosion:
+    """
+    爆発エフェクトに関するクラス
+    画像は共有の画像セットを参照するだけで，各インスタンスは残り時間と位置だけを持つ
+    """
+    __slots__ = ("imgs", "life", "rct")
+    frames = ExplosionFrames()  # 全ての爆発で共有する画像セットのキャッシュ
+
+    def __init__(self, xy: tuple[int, int], charge: int = 0, quality: QualityLevel = QUALITY_LEVELS[0]):
+        """
+        爆発エフェクトの初期化
+        引数1 xy：爆発の中心座標（爆発する爆弾の中心）
+        引数2 charge：チャージ量
+        引数3 quality：画質の段階（画像の大きさと表示時間を変える）
+        """
+        self.reset(xy, charge, quality)
+
+    def reset(self, xy: tuple[int, int], charge: int = 0, quality: QualityLevel = QUALITY_LEVELS[0]):
+        """
+        爆発エフェクトを（再）初期化する（プールから再利用するときに呼ばれる）
+        引数1 xy：爆発の中心座標（爆発する爆弾の中心）
+        引数2 charge：チャージ量
+        引数3 quality：画質の段階（画像の大きさと表示時間を変える）
+        """
+        # 通常の爆発（gifベース）
+        self.imgs = __class__.frames.get_frames(quality.explosion_charge(charge))
+        self.life = quality.scale_life(20)
+        self.rct = self.imgs[0].get_rect()
+        self.rct.center = xy
+
+    def is_alive(self) -> bool:
+        """
+        まだ表示中か
+        """
+        return self.life > 0
+
+    def step(self):
+        """
+        爆発エフェクトを1フレーム進める
         """
         self.life -= 1
+
+    def draw(self, renderer: "Renderer"):
+        """
+        爆発エフェクトを表示
+        引数 renderer：描画先のRenderer
+        """
         if self.life > 0:
-            self.img = self.imgs[self.life % 4]
-            screen.blit(self.img, self.rct)
+            renderer.blit(self.imgs[self.life % 4], self.rct)
 
 
 class ChargeBar:
@@ -367,15 +1323,15 @@ class ChargeBar:
         self.x = WIDTH // 2 - self.width // 2
         self.y = 30
     
-    def update(self, screen: pg.Surface, charge: int):
+    def draw(self, renderer: "Renderer", charge: int):
         """
         チャージゲージを表示
-        引数1 screen：画面Surface
+        引数1 renderer：描画先のRenderer
         引数2 charge：現在のチャージ量
         """
         if charge > 0:
             # 枠
-            pg.draw.rect(screen, (255, 255, 255), (self.x, self.y, self.width, self.height), 2)
+            renderer.rect((255, 255, 255), (self.x, self.y, self.width, self.height), 2)
             
             # ゲージの色（100以上で赤く点滅）
             if charge > 100:
@@ -385,194 +1341,1716 @@ class ChargeBar:
             
             # チャージ量に応じたゲージ
             bar_width = min(self.width, int(self.width * charge / 100))
-            pg.draw.rect(screen, color, (self.x, self.y, bar_width, self.height))
+            renderer.rect(color, (self.x, self.y, bar_width, self.height))
             
             # オーバーチャージ警告
             if charge > 100:
-                font = pg.font.Font(None, 30)
-                warning = font.render("DANGER!", True, (255, 0, 0))
-                screen.blit(warning, (self.x + self.width + 10, self.y))
+                warning = text_cache.render(None, 30, "DANGER!", (255, 0, 0))
+                renderer.blit(warning, (self.x + self.width + 10, self.y))
+
+def show_game_over(renderer: "Renderer") -> None:
+    """ゲームオーバー画面を描画する。
 
-def show_game_over(screen: pg.Surface, kk_img: pg.Surface, kk_rct: pg.Rect) -> None:
-    """ゲームオーバー画面を表示する。
-    
     引数:
-      screen (pg.Surface): 描画対象のスクリーン表面
-      kk_img (pg.Surface): こうかとん画像（現在は使用されない）
-      kk_rct (pg.Rect): こうかとんの矩形（現在は使用されない）
-    
+      renderer (Renderer): 描画先のRenderer
+
     戻り値:
       なし（None）
-    
+
     動作:
       1. 背景を黒で塗りつぶす
       2. こうかとん（fig/8.png）を 1.5 倍に縮放して中央下に配置
       3. 赤い \"GameOver\" テキストを中央に配置
-      4. すべてを描画して画面更新
-      5. 2000 ms（2 秒）待機
+      4. 再開の案内を下に配置
+      （待機はしない。画面更新と再開の受付はメインループが行う）
     """
     # 背景を真っ暗にする
-    screen.fill((0, 0, 0))
+    renderer.rect((0, 0, 0), (0, 0, WIDTH, HEIGHT))
 
     # こうかトンの画像を切り替えて中央に配置
-    kk_img = pg.transform.rotozoom(pg.image.load("fig/8.png"), 0, 1.5)   
+    kk_img = sprite_cache.load("fig/8.png", 0, 1.5)
     kk_rct = kk_img.get_rect()
     kk_rct.center = (WIDTH // 2, HEIGHT // 2 + 100)
 
     # GameOver テキスト
-    font = pg.font.Font(None, 100)
-    txt_surf = font.render("GameOver", True, (255, 0, 0))
+    txt_surf = text_cache.render(None, 100, "GameOver", (255, 0, 0))
     txt_rct = txt_surf.get_rect()
     txt_rct.center = (WIDTH // 2, HEIGHT // 2)
 
+    # 再開の案内
+    hint_surf = text_cache.render(None, 30, "Press ENTER to play again", (255, 255, 255))
+    hint_rct = hint_surf.get_rect()
+    hint_rct.center = (WIDTH // 2, HEIGHT - 60)
+
     # 描画
-    screen.blit(kk_img, kk_rct)
-    screen.blit(txt_surf, txt_rct)
-    pg.display.update()
-    # 表示を見せるために短く待機
-    pg.time.wait(2000)
+    renderer.blit(kk_img, kk_rct)
+    renderer.blit(txt_surf, txt_rct)
+    renderer.blit(hint_surf, hint_rct)
 
 
-def main():
+class Renderer:
     """
-    ゲームのメイン処理
+    描画バックエンドの基本クラス（各エンティティはこのメソッドを通して描画する）
+    このクラス自体は画面Surfaceにソフトウェアで描き，毎フレーム背景ごと全面を描き直す
     """
-    pg.display.set_caption("たたかえ！こうかとん")
-    screen = pg.display.set_mode((WIDTH, HEIGHT))    
-    bg_img = pg.image.load("fig/pg_bg.jpg")
-    bird = Bird((300, 200))
-    clock = pg.time.Clock()
-    tmr = 0
-
-    # 複数の爆弾を生成
-    bombs = [Bomb((255, 0, 0), 10) for _ in range(NUM_OF_BOMBS)]
-    # スコア表示用のインスタンスを生成
-    score = Score()
-    # ビームのリスト
-    beams = []  
-    # 爆発エフェクトのリスト
-    explosions = []
-    # チャージバー
-    charge_bar = ChargeBar()
-    # チャージ中かどうか
-    charging = False
+    def __init__(self, screen: pg.Surface, bg_img: pg.Surface):
+        """
+        引数1 screen：画面Surface
+        引数2 bg_img：背景画像Surface
+        """
+        self.surface = screen
+        self.bg_img = bg_img
+
+    def begin(self):
+        """
+        フレームの描画を開始する（背景を描く）
+        """
+        self.surface.blit(self.bg_img, [0, 0])
+
+    def blit(self, img: pg.Surface, dest) -> pg.Rect:
+        """
+        画像を転送し，更新された矩形を返す
+        """
+        return self.mark(self.surface.blit(img, dest))
+
+    def blits(self, seq: list):
+        """
+        (画像, 位置)の列をまとめて転送する
+        """
+        self.surface.blits(seq, False)
+
+    def rect(self, color, rct, width: int = 0) -> pg.Rect:
+        """
+        矩形を描き，更新された矩形を返す
+        """
+        return self.mark(pg.draw.rect(self.surface, color, rct, width))
+
+    def mark(self, rct: pg.Rect) -> pg.Rect:
+        """
+        surfaceに直接描いた領域を更新領域として登録する
+        """
+        return rct
+
+    def invalidate(self):
+        """
+        次のフレームを全面描き直しにする（場面の切り替え時に呼ぶ）
+        """
+
+    def present(self):
+        """
+        描いた内容を画面に反映する
+        """
+        pg.display.update()
+
+
+class DirtyRectRenderer(Renderer):
+    """
+    動いた部分の背景だけを描き直し，その矩形だけを画面に反映するクラス
+    """
+    def __init__(self, screen: pg.Surface, bg_img: pg.Surface):
+        """
+        引数1 screen：画面Surface
+        引数2 bg_img：背景画像Surface
+        """
+        super().__init__(screen, bg_img)
+        self.prev: list[pg.Rect] = []  # 前のフレームで描いた矩形
+        self.cur: list[pg.Rect] = []  # このフレームで描いた矩形
+        self.full = True  # 次のフレームを全面描き直しにするか
+
+    def begin(self):
+        """
+        前のフレームで描いた矩形の下の背景だけを復元する
+        """
+        if self.full:
+            super().begin()
+            return
+        bg_img, screen = self.bg_img, self.surface
+        for rct in self.prev:
+            screen.blit(bg_img, rct, rct)
+
+    def blits(self, seq: list):
+        for rct in self.surface.blits(seq):
+            self.mark(rct)
+
+    def mark(self, rct: pg.Rect) -> pg.Rect:
+        if rct.width > 0 and rct.height > 0:
+            self.cur.append(rct)
+        return rct
+
+    def invalidate(self):
+        self.full = True
+
+    def present(self):
+        """
+        前のフレームと今のフレームで描いた矩形だけを画面に反映する
+        """
+        if self.full:
+            pg.display.update()
+            self.full = False
+        else:
+            pg.display.update(self.prev + self.cur)
+        self.prev, self.cur = self.cur, []
+
+
+class TextureRenderer(Renderer):
+    """
+    pygame._sdl2.videoのRenderer/Textureで描画するクラス
+    画像は初回の転送時にTextureに変換してキャッシュし，描画命令はSDLがまとめて実行する
+    """
+    def __init__(self, bg_img: pg.Surface, driver: str | None = None,
+                 title: str = "たたかえ！こうかとん"):
+        """
+        専用のウィンドウとSDLのRendererを生成する（pg.display.set_modeとは併用しない）
+        引数1 bg_img：背景画像Surface
+        引数2 driver：SDLのレンダラーのドライバ名（"software"など，Noneなら自動）
+        引数3 title：ウィンドウのタイトル
+        """
+        # 描画命令をまとめて実行させる（Rendererの生成前に設定する）
+        os.environ.setdefault("SDL_RENDER_BATCHING", "1")
+        from pygame._sdl2 import video  # pygame 2のSDL2向けの機能（無ければこの描画方式は使えない）
+        self.video = video
+        names = [info.name for info in video.get_drivers()]
+        if driver is not None and driver not in names:
+            raise ValueError(f"SDLのレンダラー {driver} はありません（{', '.join(names)}）")
+        self.window = video.Window(title, (WIDTH, HEIGHT))
+        self.sdl = video.Renderer(self.window, index=names.index(driver) if driver else -1)
+        self.surface = None  # 画面Surfaceは無い
+        self.bg_img = bg_img
+        self.bg = video.Texture.from_surface(self.sdl, bg_img)
+        # Surface -> Texture（Surfaceが使われなくなったら一緒に消える）
+        self.textures: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    def texture(self, img: pg.Surface):
+        """
+        Surfaceに対応するTextureを返す（初回のみ生成）
+        """
+        tex = self.textures.get(img)
+        if tex is None:
+            tex = self.textures[img] = self.video.Texture.from_surface(self.sdl, img)
+        return tex
+
+    def begin(self):
+        self.bg.draw(dstrect=(0, 0))
+
+    def blit(self, img: pg.Surface, dest) -> pg.Rect:
+        rct = img.get_rect(topleft=(dest[0], dest[1]))
+        self.texture(img).draw(dstrect=rct)
+        return rct
+
+    def blits(self, seq: list):
+        last, tex, w, h = None, None, 0, 0
+        for img, dest in seq:
+            # 同じ画像が続く間はTextureを引き直さない
+            if img is not last:
+                last, tex = img, self.texture(img)
+                w, h = img.get_size()
+            tex.draw(dstrect=(dest[0], dest[1], w, h))
+
+    def rect(self, color, rct, width: int = 0) -> pg.Rect:
+        rct = pg.Rect(rct)
+        self.sdl.draw_color = (*color[:3], 255)
+        if width == 0:
+            self.sdl.fill_rect(rct)
+        else:
+            for i in range(width):
+                self.sdl.draw_rect(rct.inflate(-2 * i, -2 * i))
+        return rct
+
+    def present(self):
+        self.sdl.present()
+
+
+def make_renderer(kind: str, screen: pg.Surface | None, bg_img: pg.Surface,
+                  driver: str | None = None) -> Renderer:
+    """
+    描画方式の名前からRendererを生成する
+    引数1 kind："full"（全面描き直し），"dirty"（差分矩形のみ），"texture"（SDLのRenderer/Texture）
+    引数2 screen：画面Surface（"texture"では使わない）
+    引数3 bg_img：背景画像Surface
+    引数4 driver："texture"で使うSDLのレンダラーのドライバ名
+    """
+    if kind == "texture":
+        return TextureRenderer(bg_img, driver)
+    if kind == "dirty":
+        return DirtyRectRenderer(screen, bg_img)
+    return Renderer(screen, bg_img)
+
+
+class DrawList(Renderer):
+    """
+    描画命令を実行せずに記録するRenderer（シミュレーションのスレッドで使う）
+    記録した命令は画像の参照と位置のコピーだけを持つので，後から別のスレッドで再生できる
+    """
+    def __init__(self):
+        self.surface = None
+        self.commands: list[tuple] = []
+
+    def begin(self):
+        self.commands.clear()
+
+    def blit(self, img: pg.Surface, dest) -> pg.Rect:
+        rct = img.get_rect(topleft=(dest[0], dest[1]))
+        self.commands.append(("blit", img, rct.topleft))
+        return rct
+
+    def blits(self, seq: list):
+        # 呼び出し側が毎回新しく作ったリストなのでそのまま持つ
+        self.commands.append(("blits", seq))
+
+    def rect(self, color, rct, width: int = 0) -> pg.Rect:
+        rct = pg.Rect(rct)
+        self.commands.append(("rect", tuple(color), rct, width))
+        return rct
+
+    def present(self):
+        pass
+
+
+class Snapshot:
+    """
+    ある時点のゲームの画面（描画命令の列）と状態を表す変更不可のスナップショット
+    """
+    __slots__ = ("tmr", "status", "rounds_over", "commands")
+
+    def __init__(self, tmr: int, status: str | None, rounds_over: int, commands: tuple):
+        """
+        引数1 tmr：スナップショットを作った時点の経過フレーム数
+        引数2 status：このフレームのシミュレーションの結果（Game.stepの戻り値）
+        引数3 rounds_over：スナップショットを作った時点でゲームオーバーになったラウンドの数
+        引数4 commands：描画命令のタプル
+        """
+        self.tmr = tmr
+        self.status = status
+        self.rounds_over = rounds_over
+        self.commands = commands
+
+    def draw(self, renderer: Renderer):
+        """
+        記録した描画命令をrendererで実行する
+        """
+        for name, *args in self.commands:
+            getattr(renderer, name)(*args)
+
+
+class _NullScope:
+    """
+    プロファイラが無効なときに使う何もしない計測区間
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SCOPE = _NullScope()
+
+
+class _Scope:
+    """
+    名前付きの計測区間（with文で使う）
+    """
+    __slots__ = ("prof", "name", "start")
+
+    def __init__(self, prof: "FrameProfiler", name: str):
+        self.prof = prof
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.prof.current.append((self.name, self.start, time.perf_counter() - self.start))
+        return False
+
+
+class FrameProfiler:
+    """
+    メインループの処理ごとの所要時間を直近のフレーム分だけ記録するプロファイラ
+    無効なときはscope()が共有の空オブジェクトを返すだけなので，ほぼ負荷がかからない
+    """
+    def __init__(self, enabled: bool = False, capacity: int = PROFILE_FRAMES):
+        """
+        引数1 enabled：最初から記録するか
+        引数2 capacity：保持するフレーム数（リングバッファの大きさ）
+        """
+        self.enabled = enabled
+        self.overlay = False  # 画面に計測結果を重ねて表示するか
+        self.frames: deque = deque(maxlen=capacity)  # (開始時刻, 所要時間, 区間のリスト)
+        self.current: list[tuple[str, float, float]] = []
+        self.frame_start = 0.0
+        self.origin = time.perf_counter()
+        self.lines: list[tuple[pg.Surface, pg.Surface]] = []  # オーバーレイの内訳（区間名, 時間）
+        self.count = 0  # 記録したフレームの通し番号（リングバッファがいっぱいでも増え続ける）
+        self.pending = False  # 次のフレームの始めから記録を有効にするか
+
+    def scope(self, name: str):
+        """
+        名前付きの計測区間を返す
+        引数 name：区間名
+        戻り値：with文で使うコンテキストマネージャ
+        """
+        if not self.enabled:
+            return _NULL_SCOPE
+        return _Scope(self, name)
+
+    def toggle(self):
+        """
+        オーバーレイ表示を切り替える（表示中は記録も有効にする）
+        フレームの途中で呼ばれるので，記録は次のbegin_frame()から始める
+        """
+        self.overlay = not self.overlay
+        if self.overlay and not self.enabled:
+            self.pending = True
+
+    def begin_frame(self):
+        """
+        フレームの計測を開始する
+        """
+        if self.pending:
+            self.enabled = True
+            self.pending = False
+        if self.enabled:
+            self.current = []
+            self.frame_start = time.perf_counter()
+
+    def end_frame(self):
+        """
+        フレームの計測を終了し，リングバッファに追加する
+        """
+        if self.enabled:
+            self.frames.append((self.frame_start, time.perf_counter() - self.frame_start, self.current))
+            self.count += 1
+
+    def breakdown(self) -> dict[str, float]:
+        """
+        記録中のフレームについて区間ごとの平均時間（ミリ秒）を返す
+        """
+        total: dict[str, float] = {}
+        for _, _, scopes in self.frames:
+            for name, _, dur in scopes:
+                total[name] = total.get(name, 0.0) + dur
+        n = max(1, len(self.frames))
+        return {name: sec * 1000 / n for name, sec in total.items()}
+
+    def draw_overlay(self, renderer: "Renderer"):
+        """
+        フレーム時間のグラフと区間ごとの内訳を画面の右上に描画する
+        引数 renderer：描画先のRenderer
+        """
+        if not self.overlay:
+            return
+        w, h = 300, 100
+        left, top = WIDTH - w - 10, 10
+        renderer.rect((0, 0, 0), (left, top, w, h))
+        # 予算（20ms）の線を高さの半分に合わせる
+        scale = h / (2 * FRAME_BUDGET_MS)
+        renderer.rect((255, 255, 0), (left, top + h // 2, w, 1))
+        recent = list(self.frames)[-w // 3:]
+        for i, (_, dur, _) in enumerate(recent):
+            ms = dur * 1000
+            bar = min(h, max(1, int(ms * scale)))
+            color = (0, 255, 0) if ms <= FRAME_BUDGET_MS else (255, 0, 0)
+            renderer.rect(color, (left + i * 3, top + h - bar, 2, bar))
+        # 内訳のテキストは10フレームごとに作り直す
+        if not self.lines or self.count % 10 == 0:
+            font = text_cache.font(None, 20)
+            self.lines = [(font.render(name, True, (255, 255, 255)),
+                           font.render(f"{ms:.2f} ms", True, (255, 255, 255)))
+                          for name, ms in sorted(self.breakdown().items(), key=lambda kv: -kv[1])]
+        for i, (name, value) in enumerate(self.lines):
+            renderer.blit(name, (left, top + h + 4 + i * 16))
+            renderer.blit(value, (left + 90, top + h + 4 + i * 16))
+
+    def export_chrome_trace(self, path: str):
+        """
+        記録中のフレームをChromeのtrace event形式のJSONに書き出す
+        （chrome://tracing や Perfetto で開ける）
+        引数 path：書き出すファイルのパス
+        """
+        events = []
+        for start, dur, scopes in self.frames:
+            events.append({"name": "frame", "ph": "X", "pid": 1, "tid": 1,
+                           "ts": (start - self.origin) * 1e6, "dur": dur * 1e6})
+            for name, s_start, s_dur in scopes:
+                events.append({"name": name, "ph": "X", "pid": 1, "tid": 1,
+                               "ts": (s_start - self.origin) * 1e6, "dur": s_dur * 1e6})
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+# 計測しないときに使うプロファイラ
+NULL_PROFILER = FrameProfiler(enabled=False)
+
+
+class Telemetry:
+    """
+    ゲーム中の出来事（ビームの発射，爆弾の撃破，オーバーチャージ，ゲームオーバー，
+    フレーム時間のヒストグラム）を1行1件のJSONでファイルに書き出す記録係
+    emit()は上限つきの待ち行列に積むだけで，書き出しは専用のスレッドが行う
+    待ち行列があふれたら記録を捨てて数えるので，ディスクが遅くてもゲームは止まらない
+    ファイルが上限の大きさを超えたら path.1, path.2, ... にずらして新しいファイルに書く
+    """
+    def __init__(self, path: str | None = None, capacity: int = TELEMETRY_QUEUE,
+                 max_bytes: int = TELEMETRY_FILE_BYTES, backups: int = TELEMETRY_BACKUPS):
+        """
+        引数1 path：書き出すファイルのパス（Noneなら何も記録しない）
+        引数2 capacity：書き出し待ちにできる記録の最大数
+        引数3 max_bytes：ファイル1つあたりの大きさの上限（バイト）
+        引数4 backups：残しておく古いファイルの数
+        """
+        self.path = path
+        self.enabled = path is not None
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.events: deque = deque()  # (経過秒, 種類, 項目) 追加と取り出しはGILの下で不可分
+        self.dropped = 0  # あふれて捨てた記録の数
+        self.written = 0  # 書き出した記録の数
+        self.origin = time.perf_counter()
+        self.hist = [0] * TELEMETRY_HIST_BINS
+        self.frames = 0
+        self.f = None
+        self.thread = None
+        self.stopping = threading.Event()
+
+    def start(self):
+        """
+        ファイルを開き，書き出しのスレッドを開始してセッションの開始を記録する
+        """
+        if not self.enabled:
+            return
+        self.f = open(self.path, "a", encoding="utf-8")
+        self.size = self.f.tell()  # 今のファイルの大きさ（バイト）
+        self.thread = threading.Thread(target=self._run, name="telemetry", daemon=True)
+        self.thread.start()
+        self.emit("session", start=time.time())
+
+    def emit(self, kind: str, **fields):
+        """
+        記録を待ち行列に積む（ロックを取らず，あふれたら捨てて数えるだけ）
+        引数1 kind：出来事の種類
+        引数2 fields：記録する項目（JSONにできる値）
+        """
+        if not self.enabled:
+            return
+        if len(self.events) >= self.capacity:
+            self.dropped += 1
+            return
+        self.events.append((time.perf_counter() - self.origin, kind, fields))
+
+    def frame(self, frame_ms: float):
+        """
+        1フレームの処理時間をヒストグラムに加え，一定フレームごとに記録する
+        引数 frame_ms：フレームの処理時間（ミリ秒）
+        """
+        if not self.enabled:
+            return
+        self.hist[min(int(frame_ms / TELEMETRY_HIST_BIN_MS), TELEMETRY_HIST_BINS - 1)] += 1
+        self.frames += 1
+        if self.frames % TELEMETRY_HIST_FRAMES == 0:
+            self.emit("frames", frame=self.frames, bin_ms=TELEMETRY_HIST_BIN_MS, counts=self.hist)
+            self.hist = [0] * TELEMETRY_HIST_BINS
+
+    def close(self):
+        """
+        残りを書き出し，セッションの終了を記録してファイルを閉じる
+        （終了の記録は待ち行列を通さず書き出しのスレッドが直接書くので，あふれていても失われない）
+        """
+        if self.thread is None:
+            return
+        self.stopping.set()
+        self.thread.join()
+        self.thread = None
+
+    def _run(self):
+        """
+        書き出しのスレッド：待ち行列を一定間隔で空にする
+        """
+        while not self.stopping.wait(TELEMETRY_FLUSH_SEC):
+            self._flush()
+        self._flush()
+        end = (time.perf_counter() - self.origin, "session_end",
+               {"frames": self.frames, "dropped": self.dropped})
+        self._write([end])
+        self.f.close()
+
+    def _flush(self):
+        """
+        待ち行列の記録を全てファイルに書き出す
+        """
+        events = self.events
+        batch = []
+        while events:
+            batch.append(events.popleft())
+        if batch:
+            self._write(batch)
+
+    def _write(self, batch: list):
+        """
+        記録を1行ずつ書き出す（書くと大きさの上限を超える行の前でファイルを切り替える）
+        引数 batch：(経過秒, 種類, 項目)のリスト
+        """
+        if not self.enabled:
+            return
+        try:
+            for t, kind, fields in batch:
+                # ensure_asciiのままなので文字数がそのままバイト数になる
+                line = json.dumps({"t": round(t, 4), "event": kind, **fields}, separators=(",", ":")) + "\n"
+                if self.size > 0 and self.size + len(line) > self.max_bytes:
+                    self._rotate()
+                self.f.write(line)
+                self.size += len(line)
+                self.written += 1
+            self.f.flush()
+        except OSError as e:
+            # 書けなくなったら以降の記録はあきらめる（ゲームは続ける）
+            log.warning("telemetry disabled: %s", e)
+            self.enabled = False
+
+    def _rotate(self):
+        """
+        path → path.1 → path.2 ... と古いファイルをずらし，新しいファイルを開く
+        """
+        self.f.close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        self.f = open(self.path, "w", encoding="utf-8")
+        self.size = 0
+
+
+# 記録しないときに使う記録係
+NULL_TELEMETRY = Telemetry()
+
+
+class KeyState:
+    """
+    押下中のキー集合をpg.key.get_pressed()と同じ添字アクセスで見せるクラス
+    """
+    def __init__(self, pressed=()):
+        """
+        引数 pressed：押下中のキーコードのイテラブル
+        """
+        self.pressed = frozenset(pressed)
+
+    def __getitem__(self, key: int) -> bool:
+        return key in self.pressed
+
+
+class KeyboardInput:
+    """
+    ウィンドウのイベントキューと実際のキーボードから入力を得るクラス
+    """
+    def poll(self) -> tuple[list, "KeyState"]:
+        """
+        1フレーム分の入力を返す
+        戻り値：(イベントのリスト, 押下キーの真理値リスト)
+        """
+        return pg.event.get(), pg.key.get_pressed()
+
+    def close(self):
+        pass
+
+
+class ScriptedInput:
+    """
+    方策（ポリシー）関数から1フレームずつ入力を生成するクラス
+    """
+    def __init__(self, policy):
+        """
+        引数 policy：フレーム番号を受け取り(イベントのリスト, 押下キーの集合)を返す関数
+        """
+        self.policy = policy
+        self.tick = 0
+
+    def poll(self) -> tuple[list, "KeyState"]:
+        """
+        1フレーム分の入力を返す
+        戻り値：(イベントのリスト, 押下キーの真理値リスト)
+        """
+        # ウィンドウがある場合に応答なしにならないようキューだけは回す
+        pg.event.pump()
+        events, pressed = self.policy(self.tick)
+        self.tick += 1
+        return events, KeyState(pressed)
 
+    def close(self):
+        pass
+
+
+def idle_policy(tick: int) -> tuple[list, set[int]]:
+    """
+    何も入力しない方策
+    """
+    return [], set()
+
+
+class RandomPolicy:
+    """
+    一定間隔で移動方向を変え，ランダムなチャージ量でビームを撃つ方策
+    """
+    def __init__(self, seed: int | None = None, hold: int = 25):
+        """
+        引数1 seed：方策の乱数シード
+        引数2 hold：同じ移動方向を保つフレーム数
+        """
+        self.rng = random.Random(seed)
+        self.hold = hold
+        self.pressed: set[int] = set()
+        self.release_at = -1  # スペースキーを離すフレーム
+
+    def __call__(self, tick: int) -> tuple[list, set[int]]:
+        events = []
+        if tick % self.hold == 0:
+            self.pressed = set(self.rng.sample(list(Bird.delta), self.rng.randint(0, 2)))
+        if self.release_at < 0 and self.rng.random() < 0.05:
+            events.append(pg.event.Event(pg.KEYDOWN, key=pg.K_SPACE))
+            self.release_at = tick + self.rng.randint(1, MAX_BEAM_CHARGE // CHARGE_STEP)
+        elif tick == self.release_at:
+            events.append(pg.event.Event(pg.KEYUP, key=pg.K_SPACE))
+            self.release_at = -1
+        return events, self.pressed
+
+
+def _put_varint(buf: bytearray, value: int):
+    """
+    0以上の整数を可変長（7ビットずつ）でbufに追加する
+    """
+    while value >= 0x80:
+        buf.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def _get_varint(f) -> int | None:
+    """
+    ファイルから可変長整数を1つ読む（ファイル末尾ならNone）
+    """
+    value = shift = 0
     while True:
-        # イベント処理（入力の受付）
-        for event in pg.event.get():
+        b = f.read(1)
+        if not b:
+            return None
+        value |= (b[0] & 0x7F) << shift
+        if b[0] < 0x80:
+            return value
+        shift += 7
+
+
+def _need_varint(f) -> int:
+    """
+    ファイルから可変長整数を1つ読む（途中でファイルが終わったらEOFError）
+    """
+    value = _get_varint(f)
+    if value is None:
+        raise EOFError
+    return value
+
+
+class ReplayRecorder:
+    """
+    1フレームごとのイベントと押下キーを差分だけ記録するバイナリのリプレイファイル
+    形式：ヘッダ（b"KKRP", 版, シード, 爆弾数, 監視キー）に続き，
+    入力に変化のあったフレームだけ (前回記録からのフレーム数, 押下キーのビット列,
+    イベント数, (種類, キー)×イベント数) を可変長整数で並べる
+    """
+    MAGIC = b"KKRP"
+    VERSION = 1
+    EVENT_CODES = {pg.QUIT: 0, pg.KEYDOWN: 1, pg.KEYUP: 2}
+
+    def __init__(self, path: str, seed: int, num_bombs: int = NUM_OF_BOMBS,
+                 keys=tuple(Bird.delta), buffering: int = 64 * 1024):
+        """
+        ファイルを開いてヘッダを書く
+        引数1 path：書き出すファイルのパス
+        引数2 seed：ゲームの乱数シード
+        引数3 num_bombs：爆弾の数
+        引数4 keys：押下状態を記録するキーコード（最大32個）
+        引数5 buffering：書き込みバッファの大きさ（バイト）
+        """
+        self.f = open(path, "wb", buffering=buffering)
+        self.keys = tuple(keys)
+        self.tick = 0
+        self.last_tick = 0
+        self.last_mask = 0
+        head = bytearray(self.MAGIC)
+        head += struct.pack("<BqI", self.VERSION, seed, num_bombs)
+        _put_varint(head, len(self.keys))
+        for k in self.keys:
+            _put_varint(head, k)
+        self.f.write(head)
+
+    def record(self, events, key_lst):
+        """
+        1フレーム分の入力を記録する（前のフレームから変化が無ければ何も書かない）
+        引数1 events：このフレームのイベントのリスト
+        引数2 key_lst：押下キーの真理値リスト
+        """
+        mask = 0
+        for bit, k in enumerate(self.keys):
+            if key_lst[k]:
+                mask |= 1 << bit
+        codes = [(self.EVENT_CODES[e.type], getattr(e, "key", 0))
+                 for e in events if e.type in self.EVENT_CODES]
+        if codes or mask != self.last_mask:
+            buf = bytearray()
+            _put_varint(buf, self.tick - self.last_tick)
+            _put_varint(buf, mask)
+            _put_varint(buf, len(codes))
+            for code, key in codes:
+                buf.append(code)
+                _put_varint(buf, key)
+            self.f.write(buf)
+            self.last_tick = self.tick
+            self.last_mask = mask
+        self.tick += 1
+
+    def close(self):
+        """
+        最後のフレームに終了イベントを記録してファイルを閉じる
+        """
+        if self.f.closed:
+            return
+        self.record([pg.event.Event(pg.QUIT)], KeyState())
+        self.f.close()
+
+
+class ReplayInput:
+    """
+    ReplayRecorderで記録したファイルから1フレームずつ入力を再生するクラス
+    """
+    def __init__(self, path: str):
+        """
+        ファイルを開いてヘッダを読む
+        引数 path：リプレイファイルのパス
+        """
+        self.path = path
+        self.f = open(path, "rb")
+        try:
+            self._read_header()
+        except BaseException:
+            self.f.close()
+            raise
+        self.types = {code: t for t, code in ReplayRecorder.EVENT_CODES.items()}
+        self.tick = 0
+        self.pressed = KeyState()
+        self._read_next()
+
+    def _read_header(self):
+        """
+        ヘッダ（シード，爆弾数，監視キー）を読む（リプレイファイルとして読めなければValueError）
+        """
+        path = self.path
+        size = len(ReplayRecorder.MAGIC) + struct.calcsize("<BqI")
+        head = self.f.read(size)
+        if head[:4] != ReplayRecorder.MAGIC:
+            raise ValueError(f"{path} はリプレイファイルではありません")
+        if len(head) < size:
+            raise ValueError(f"{path} のヘッダが途中で切れています")
+        version, self.seed, self.num_bombs = struct.unpack("<BqI", head[4:])
+        if version != ReplayRecorder.VERSION:
+            raise ValueError(f"対応していないリプレイの版です: {version}")
+        try:
+            self.keys = [_need_varint(self.f) for _ in range(_need_varint(self.f))]
+        except EOFError:
+            raise ValueError(f"{path} のヘッダが途中で切れています") from None
+
+    def _read_next(self):
+        """
+        次に入力が変化するフレームの記録を読んでおく
+        （異常終了などで最後の記録が途中で切れていたら，そこを記録の終わりとみなす）
+        """
+        self.next_tick = None
+        delta = _get_varint(self.f)
+        if delta is None:
+            self.close()
+            return
+        try:
+            mask = _need_varint(self.f)
+            events = []
+            for _ in range(_need_varint(self.f)):
+                code = self.f.read(1)
+                if not code:
+                    raise EOFError
+                kind = self.types.get(code[0])
+                if kind is None:
+                    raise EOFError
+                key = _need_varint(self.f)
+                if kind == pg.QUIT:
+                    events.append(pg.event.Event(pg.QUIT))
+                else:
+                    events.append(pg.event.Event(kind, key=key))
+        except EOFError:
+            log.warning("replay %s: truncated or corrupt record after tick %d, stopping playback", self.path, self.tick)
+            self.close()
+            return
+        self.next_tick = self.tick + delta
+        self.next_pressed = KeyState(k for bit, k in enumerate(self.keys) if mask >> bit & 1)
+        self.next_events = events
+
+    def poll(self) -> tuple[list, KeyState]:
+        """
+        1フレーム分の入力を返す（記録が尽きたら終了イベントを返す）
+        戻り値：(イベントのリスト, 押下キーの真理値リスト)
+        """
+        pg.event.pump()
+        if self.next_tick is None:
+            return [pg.event.Event(pg.QUIT)], KeyState()
+        events = []
+        if self.tick == self.next_tick:
+            events = self.next_events
+            self.pressed = self.next_pressed
+            self._read_next()
+        self.tick += 1
+        return events, self.pressed
+
+    def close(self):
+        """
+        リプレイファイルを閉じる（記録を読み終えたときにも呼ばれる）
+        """
+        self.f.close()
+
+
+class World:
+    """
+    描画から切り離したゲームの状態（こうかとん・爆弾・ビーム・爆発・スコア）と
+    1フレーム分の更新処理に関するクラス
+    """
+    def __init__(self, seed: int | None = None, num_bombs: int = NUM_OF_BOMBS, pooling: bool = True,
+                 max_charge: int = MAX_BEAM_CHARGE, score_base: int = SCORE_BASE,
+                 score_charge_div: float = SCORE_CHARGE_DIV, telemetry: Telemetry = NULL_TELEMETRY):
+        """
+        ゲーム状態を初期化する
+        引数1 seed：爆弾の配置や爆発に使う乱数シード（Noneなら毎回異なる）
+        引数2 num_bombs：爆弾の数
+        引数3 pooling：ビームと爆発エフェクトをプールから再利用するか
+        引数4 max_charge：ビームを撃てる最大チャージ量（超えると大爆発）
+        引数5 score_base：爆弾1個あたりの基本スコア
+        引数6 score_charge_div：スコア倍率 1 + チャージ量/score_charge_div の分母
+        引数7 telemetry：ビームの発射や爆弾の撃破を記録するTelemetry
+        """
+        self.rng = random.Random(seed)
+        self.bird = Bird((300, 200))
+        # 複数の爆弾を生成
+        self.bombs = BombSwarm(num_bombs, (255, 0, 0), 10, self.rng)
+        # スコア表示用のインスタンスを生成
+        self.score = Score()
+        # ビームのリストとプール
+        self.beams = []
+        self.beam_pool = Pool(Beam, BEAM_POOL_SIZE, pooling)
+        # 爆発エフェクトのリストとプール
+        self.explosions = []
+        self.explosion_pool = Pool(Explosion, EXPLOSION_POOL_SIZE, pooling)
+        # オーバーチャージ時の大爆発
+        self.big_explosion = None
+        # チャージ中かどうか
+        self.charging = False
+        self.tmr = 0
+        # ルールのパラメータ
+        self.max_charge = max_charge
+        self.score_base = score_base
+        self.score_charge_div = score_charge_div
+        # 演出の画質の段階（描画が重いときにQualityGovernorが下げる）
+        self.quality = QUALITY_LEVELS[0]
+        # 集計用のカウンタ
+        self.beams_fired = 0
+        self.overcharges = 0
+        self.telemetry = telemetry
+
+    def handle_events(self, events) -> bool:
+        """
+        イベントに応じてチャージの開始とビームの発射を行う
+        引数 events：イベントのリスト
+        戻り値：終了要求(QUIT)があればTrue
+        """
+        bird = self.bird
+        for event in events:
             if event.type == pg.QUIT:
-                return
+                return True
             if event.type == pg.KEYDOWN and event.key == pg.K_SPACE:
-                charging = True
+                self.charging = True
                 bird.charge = 0
             if event.type == pg.KEYUP and event.key == pg.K_SPACE:
-                charging = False
+                self.charging = False
                 # 150以下の場合のみビーム発射
-                if bird.charge <= 150:
-                    beams.append(Beam(bird, bird.charge))
+                if bird.charge <= self.max_charge:
+                    self.beams.append(self.beam_pool.acquire(bird, bird.charge))
+                    self.beams_fired += 1
+                    self.telemetry.emit("beam", tick=self.tmr, charge=bird.charge)
                 bird.charge = 0
-        
-        # チャージ中はチャージ量を増やす
-        if charging:
-            bird.charge += 2  # 1フレームあたり2増加
+        return False
+
+    def update_charge(self) -> bool:
+        """
+        チャージ中はチャージ量を増やし，上限を超えたら大爆発を起こす
+        戻り値：オーバーチャージしたらTrue
+        """
+        bird = self.bird
+        if self.charging:
+            bird.charge += CHARGE_STEP  # 1フレームあたり2増加
             # マックス（150超過）で即座に爆発
-            if bird.charge > 150:
-                charging = False
-                big_explosion = BigExplosion(bird.rct.center, bird.charge)
+            if bird.charge > self.max_charge:
+                self.charging = False
+                self.overcharges += 1
+                self.telemetry.emit("overcharge", tick=self.tmr, charge=bird.charge)
+                self.big_explosion = BigExplosion(bird.rct.center, bird.charge, self.rng, self.quality)
                 bird.charge = 0
-                
-                # 爆発アニメーションを表示してからゲームオーバー
-                explosion_timer = 0
-                while explosion_timer < 60:  # 爆発の表示時間
-                    screen.blit(bg_img, [0, 0])
-                    
-                    # 爆弾を表示
-                    for bomb in bombs:
-                        bomb.update(screen)
-                    
-                    # こうかとんは表示しない（消す）
-                    
-                    # 大爆発エフェクトを表示
-                    big_explosion.update(screen)
-                    # アニメーションの更新
-                    score.update(screen)
-                    pg.display.update()
-                    clock.tick(50)
-                    explosion_timer += 1
-                
-                # ゲームオーバー表示
-                show_game_over(screen, bird.img, bird.rct)
-                time.sleep(2)
-                return
-        
-        # 画面の描画           
-        screen.blit(bg_img, [0, 0])
+                return True
+        return False
+
+    def collide(self) -> bool:
+        """
+        爆弾とビーム，爆弾とこうかとんの衝突を判定する
+        戻り値：こうかとんが爆弾に当たったらTrue
+        """
+        bombs, beams = self.bombs, self.beams
+        # ビームがあれば爆弾をCOLLISION_CELL四方の格子に振り分け，ビームと重なる格子の爆弾だけを判定する
+        if beams:
+            bombs.rebuild()
 
         # 爆弾とビームの衝突時
         # チャージ量に応じた爆発エフェクトとスコア加算
-        for i, bomb in enumerate(bombs):
-            # 各ビームと衝突判定
-            for j, beam in enumerate(beams):
-                # Noneチェックを追加
-                if bomb is not None and beam is not None:
-                    # 衝突判定
-                    if beam.rct.colliderect(bomb.rct):
-                        # 爆発生成
-                        explosions.append(Explosion(bomb, beam.charge))  
-                        bombs[i] = None
-                        beams[j] = None
-                        # チャージ量に応じてスコア加算
-                        score.score += int(100 * (1 + beam.charge / 50))
+        for i, j in find_beam_hits(bombs, beams):
+            beam = beams[j]
+            # 爆発生成
+            self.explosions.append(self.explosion_pool.acquire(bombs.center(i), beam.charge, self.quality))
+            bombs.destroy(i)
+            beam.alive = False
+            # チャージ量に応じてスコア加算
+            delta = int(self.score_base * (1 + beam.charge / self.score_charge_div))
+            self.score.score += delta
+            self.telemetry.emit("bomb", tick=self.tmr, charge=beam.charge, score=delta)
 
+        # 残っている爆弾とこうかとんの衝突判定
+        return bombs.collides(self.bird.rct)
+
+    def compact(self):
+        """
+        寿命の尽きた爆発，消えたビーム・爆弾をリストから取り除く
+        （リストは作り直さず，取り除いたビームと爆発はプールに戻す）
+        """
         # lifeが0より大きい爆発だけ残す
-        explosions = [exp for exp in explosions if exp.life > 0]
+        swap_remove(self.explosions, Explosion.is_alive, self.explosion_pool)
+        # 爆弾に当たっておらず画面内にあるビームだけ残す
+        swap_remove(self.beams, Beam.is_alive, self.beam_pool)
+        # ビームに当たっていない爆弾だけ残す
+        self.bombs.compact()
 
-        # Noneでないビームだけに更新
-        beams = [beam for beam in beams if beam is not None]
+    def move_bombs(self):
+        """
+        全ての爆弾を移動させる
+        """
+        self.bombs.move()
 
-        # 画面外に出たビームを削除
-        beams = [beam for beam in beams if check_bound(beam.rct) == (True, True)]
-        
-        # Noneでない爆弾だけに更新
-        bombs = [bomb for bomb in bombs if bomb is not None]
-
-        # 各爆弾とこうかとんの衝突判定
-        for bomb in bombs:
-            if bird.rct.colliderect(bomb.rct):
-                # 以前の処理を全て削除し、関数呼び出しに置き換える
-                show_game_over(screen, bird.img, bird.rct)
-                # ゲームオーバーになったらループを抜ける、またはゲームを終了する
-                return
-            
-        # 各爆弾の更新
-        for bomb in bombs:
-            bomb.update(screen)
-        
-        # キャラクターの更新（移動/描画）
-        key_lst = pg.key.get_pressed()
-        bird.update(key_lst, screen)
-        
-        # 各ビームの更新
-        for beam in beams:
-            beam.update(screen)
+    def move_bird(self, key_lst):
+        """
+        押下キーに応じてこうかとんを移動させる
+        引数 key_lst：押下キーの真理値リスト
+        """
+        self.bird.move(key_lst)
 
-        # 爆発エフェクトの更新
-        for exp in explosions:
-            exp.update(screen)
+    def move_beams(self):
+        """
+        各ビームを移動させる
+        """
+        for beam in self.beams:
+            beam.move()
 
-        # スコアの更新
-        score.update(screen)
-        
-        # チャージバーの更新
-        charge_bar.update(screen, bird.charge)
-        # 画面更新
-        pg.display.update()
-        tmr += 1
-        clock.tick(50)
+    def step_explosions(self):
+        """
+        爆発エフェクトを1フレーム進める
+        """
+        for exp in self.explosions:
+            exp.step()
+
+    def step(self, events, key_lst, prof: FrameProfiler = NULL_PROFILER) -> str | None:
+        """
+        1フレーム分ゲームを進める（描画はしない）
+        引数1 events：このフレームのイベントのリスト
+        引数2 key_lst：押下キーの真理値リスト
+        引数3 prof：処理ごとの時間を計るプロファイラ
+        戻り値："quit"（終了要求），"overcharge"（大爆発），"hit"（被弾），
+                それ以外はNone
+        """
+        with prof.scope("events"):
+            if self.handle_events(events):
+                return "quit"
+        with prof.scope("charge"):
+            if self.update_charge():
+                return "overcharge"
+        with prof.scope("collision"):
+            if self.collide():
+                return "hit"
+        with prof.scope("compact"):
+            self.compact()
+        with prof.scope("update"):
+            self.move_bombs()
+            self.move_bird(key_lst)
+            self.move_beams()
+            self.step_explosions()
+        self.tmr += 1
+        return None
+
+    def step_overcharge(self):
+        """
+        大爆発の演出中の1フレームを進める（爆弾と大爆発だけが動く）
+        """
+        self.move_bombs()
+        self.big_explosion.step()
+        self.tmr += 1
+
+    def draw(self, renderer: Renderer, charge_bar: "ChargeBar", alpha: float = 1.0):
+        """
+        現在の状態を描画する（背景はrenderer.begin()で描かれる）
+        引数1 renderer：描画先のRenderer
+        引数2 charge_bar：チャージバー
+        引数3 alpha：前回の更新からの補間の割合（1なら最新の位置に描く）
+        """
+        self.bombs.draw(renderer, alpha)
+        self.bird.draw(renderer, alpha)
+        for beam in self.beams:
+            beam.draw(renderer, alpha)
+        for exp in self.explosions:
+            exp.draw(renderer)
+        self.score.draw(renderer)
+        charge_bar.draw(renderer, self.bird.charge)
+
+    def draw_overcharge(self, renderer: Renderer, alpha: float = 1.0):
+        """
+        大爆発の演出中の画面を描画する（こうかとんは表示しない）
+        引数1 renderer：描画先のRenderer
+        引数2 alpha：前回の更新からの補間の割合
+        """
+        self.bombs.draw(renderer, alpha)
+        self.big_explosion.draw(renderer, alpha)
+        self.score.draw(renderer)
+
+
+class Game:
+    """
+    場面（プレイ中→大爆発→ゲームオーバー→再開）を切り替えるステートマシンに関するクラス
+    どの場面もメインループから1フレームずつ進めるので，待機中もイベントは処理され続ける
+    再開時はWorldだけを作り直し，画面や読み込み済みの画像はそのまま使う
+    """
+    PLAYING = "playing"
+    OVERCHARGE = "overcharge"
+    GAME_OVER = "game_over"
+
+    def __init__(self, seed: int | None = None, num_bombs: int = NUM_OF_BOMBS,
+                 telemetry: Telemetry = NULL_TELEMETRY, **rules):
+        """
+        最初のラウンドを開始する
+        引数1 seed：最初のラウンドの乱数シード（k回目のラウンドはseed+k，Noneなら毎回異なる）
+        引数2 num_bombs：爆弾の数
+        引数3 telemetry：ゲーム中の出来事を記録するTelemetry
+        引数4 rules：Worldに渡すルールのパラメータ
+        """
+        self.seed = seed
+        self.num_bombs = num_bombs
+        self.telemetry = telemetry
+        self.rules = rules
+        self.round = -1  # 何回目のラウンドか（0始まり）
+        self.rounds_over = 0  # ゲームオーバーになったラウンドの数
+        self.tmr = 0  # 全ラウンドを通した経過フレーム数
+        self.new_round()
+
+    def new_round(self):
+        """
+        新しいラウンドを始める（Worldだけを作り直す）
+        """
+        self.round += 1
+        seed = None if self.seed is None else self.seed + self.round
+        self.world = World(seed, self.num_bombs, telemetry=self.telemetry, **self.rules)
+        self.scene = __class__.PLAYING
+        self.overcharge_left = 0  # 大爆発の演出の残りフレーム数
+
+    def step(self, events, key_lst, prof: FrameProfiler = NULL_PROFILER) -> str | None:
+        """
+        現在の場面を1フレーム進める
+        引数1 events：このフレームのイベントのリスト
+        引数2 key_lst：押下キーの真理値リスト
+        引数3 prof：処理ごとの時間を計るプロファイラ
+        戻り値："quit"（終了要求），場面が切り替わったら切り替わった先の場面名
+                （"overcharge"，"game_over"，"playing"），それ以外はNone
+        """
+        self.tmr += 1
+        world = self.world
+        if self.scene == __class__.PLAYING:
+            status = world.step(events, key_lst, prof)
+            if status == "quit":
+                return status
+            if status == "overcharge":
+                self.scene = __class__.OVERCHARGE
+                self.overcharge_left = world.big_explosion.life  # 爆発の表示時間
+                return self.scene
+            if status == "hit":
+                return self._game_over("hit")
+            return None
+        for event in events:
+            if event.type == pg.QUIT:
+                return "quit"
+        if self.scene == __class__.OVERCHARGE:
+            # 爆発アニメーションを表示してからゲームオーバー
+            world.step_overcharge()
+            self.overcharge_left -= 1
+            if self.overcharge_left <= 0:
+                return self._game_over("overcharge")
+            return None
+        # ゲームオーバー画面ではEnterキーですぐに次のラウンドを始める
+        for event in events:
+            if event.type == pg.KEYDOWN and event.key == pg.K_RETURN:
+                self.new_round()
+                return self.scene
+        return None
+
+    def _game_over(self, cause: str) -> str:
+        """
+        ゲームオーバー画面に切り替える
+        引数 cause：ゲームオーバーになった理由（"hit"，"overcharge"）
+        """
+        self.scene = __class__.GAME_OVER
+        self.rounds_over += 1
+        world = self.world
+        self.telemetry.emit("game_over", round=self.round, cause=cause, tick=world.tmr,
+                            score=world.score.score, beams=world.beams_fired)
+        return self.scene
+
+    def draw(self, renderer: Renderer, charge_bar: "ChargeBar", alpha: float = 1.0):
+        """
+        現在の場面を描画する（背景はrenderer.begin()で描かれる）
+        引数1 renderer：描画先のRenderer
+        引数2 charge_bar：チャージバー
+        引数3 alpha：前回の更新からの補間の割合
+        """
+        if self.scene == __class__.PLAYING:
+            self.world.draw(renderer, charge_bar, alpha)
+        elif self.scene == __class__.OVERCHARGE:
+            self.world.draw_overcharge(renderer, alpha)
+        else:
+            show_game_over(renderer)
+
+
+def run_ticks(game: Game, events: list, key_lst, ticks: int, recorder=None,
+              prof: FrameProfiler = NULL_PROFILER, max_ticks: int = 0) -> str | None:
+    """
+    ゲームをticks回進める（場面が切り替わったらそこで止める）
+    引数1 game：ゲーム
+    引数2 events：最初の1回に渡すイベントのリスト
+    引数3 key_lst：押下キーの真理値リスト
+    引数4 ticks：進める回数
+    引数5 recorder：入力を記録するReplayRecorder（Noneなら記録しない）
+    引数6 prof：処理ごとの時間を計るプロファイラ
+    引数7 max_ticks：経過フレーム数の上限（0で無制限）
+    戻り値：最後に進めたときのGame.stepの戻り値
+    """
+    status = None
+    for _ in range(ticks):
+        if recorder is not None:
+            recorder.record(events, key_lst)
+        status = game.step(events, key_lst, prof)
+        events = []
+        if status is not None or game.tmr == max_ticks:
+            break
+    return status
+
+
+class SnapshotBuffer:
+    """
+    シミュレーションのスレッドから描画のスレッドへスナップショットを渡すダブルバッファ
+    描画側が表示中のもの（表）とは別に，次の1枚（裏）だけを置ける
+    裏が受け取られるまで次の1枚は置けないので，シミュレーションは描画より1フレームだけ先に進む
+    """
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.back: Snapshot | None = None
+
+    def publish(self, snap: Snapshot):
+        """
+        次の1枚を置く（前の1枚がまだ受け取られていなければ待つ）
+        """
+        with self.cond:
+            while self.back is not None:
+                self.cond.wait()
+            self.back = snap
+            self.cond.notify_all()
+
+    def take(self) -> Snapshot:
+        """
+        次の1枚を受け取る（まだ置かれていなければ待つ）
+        """
+        with self.cond:
+            while self.back is None:
+                self.cond.wait()
+            snap, self.back = self.back, None
+            self.cond.notify_all()
+            return snap
+
+
+class SimulationThread(threading.Thread):
+    """
+    入力を受け取ってゲームを進め，描画命令のスナップショットを作るスレッド
+    描画（メイン）スレッドがフレームNを描いている間にフレームN+1を計算する
+    ゲームにはこのスレッドしか触れず，描画スレッドとはsubmit()とスナップショットだけでやり取りする
+    """
+    def __init__(self, game: Game, charge_bar: "ChargeBar", recorder=None, max_ticks: int = 0):
+        """
+        引数1 game：ゲーム（以後はこのスレッドだけが進める）
+        引数2 charge_bar：チャージバー
+        引数3 recorder：入力を記録するReplayRecorder
+        引数4 max_ticks：経過フレーム数の上限（0で無制限）
+        """
+        super().__init__(name="simulation", daemon=True)
+        self.game = game
+        self.charge_bar = charge_bar
+        self.recorder = recorder
+        self.max_ticks = max_ticks
+        self.inbox: queue.Queue = queue.Queue()
+        self.buffer = SnapshotBuffer()
+        self.error: BaseException | None = None
+
+    def submit(self, events: list, key_lst, ticks: int, alpha: float = 1.0,
+               quality: QualityLevel | None = None):
+        """
+        次のフレームの入力を渡す
+        引数1 events：イベントのリスト
+        引数2 key_lst：押下キーの真理値リスト
+        引数3 ticks：進める回数
+        引数4 alpha：描画の補間の割合
+        引数5 quality：このフレームから使う演出の画質（Noneなら変えない）
+        """
+        self.inbox.put((events, key_lst, ticks, alpha, quality))
+
+    def take(self) -> Snapshot:
+        """
+        計算済みの次のスナップショットを受け取る
+        """
+        snap = self.buffer.take()
+        if self.error is not None:
+            raise self.error
+        return snap
+
+    def stop(self):
+        """
+        スレッドを終了させて待つ
+        """
+        self.inbox.put(None)
+        self.join()
+
+    def snapshot(self, status: str | None, alpha: float) -> Snapshot:
+        """
+        現在の状態を描画命令として記録する
+        """
+        dl = DrawList()
+        self.game.draw(dl, self.charge_bar, alpha)
+        return Snapshot(self.game.tmr, status, self.game.rounds_over, tuple(dl.commands))
+
+    def run(self):
+        # 最初の1枚（まだ進めていない状態）を用意しておく
+        self.buffer.publish(self.snapshot(None, 1.0))
+        game = self.game
+        while True:
+            job = self.inbox.get()
+            if job is None:
+                break
+            events, key_lst, ticks, alpha, quality = job
+            try:
+                if quality is not None:
+                    game.world.quality = quality
+                if self.max_ticks > 0 and game.tmr >= self.max_ticks:
+                    ticks = 0
+                status = run_ticks(game, events, key_lst, ticks, self.recorder, max_ticks=self.max_ticks)
+                snap = self.snapshot(status, alpha)
+            except BaseException as e:
+                # 描画スレッドで例外を出し直す
+                self.error = e
+                snap = Snapshot(game.tmr, "quit", game.rounds_over, ())
+            self.buffer.publish(snap)
+
+
+class FixedTimestep:
+    """
+    経過した実時間を積算し，一定間隔で進めるべきシミュレーションの回数を決めるクラス
+    """
+    def __init__(self, rate: int = TICK_RATE, max_skip: int = MAX_FRAME_SKIP):
+        """
+        引数1 rate：1秒あたりのシミュレーション更新回数
+        引数2 max_skip：描画1回あたりに進める最大回数（これを超える遅れは切り捨てる）
+        """
+        self.dt = 1.0 / rate
+        self.max_skip = max_skip
+        self.acc = 0.0  # まだシミュレーションに消化していない時間
+        self.last = time.perf_counter()
+
+    def advance(self) -> int:
+        """
+        前回の呼び出しからの経過時間を積算し，今回進める回数を返す
+        """
+        now = time.perf_counter()
+        self.acc += now - self.last
+        self.last = now
+        # 処理が追いつかないほど遅れた分は諦める（ゲームが一時的に遅くなる）
+        self.acc = min(self.acc, self.dt * self.max_skip)
+        ticks = int(self.acc / self.dt)
+        self.acc -= ticks * self.dt
+        return ticks
+
+    @property
+    def alpha(self) -> float:
+        """
+        最新の更新から次の更新までのどこにいるか（描画の補間の割合）
+        """
+        return self.acc / self.dt
+
+
+class QualityGovernor:
+    """
+    直近のフレーム時間を監視し，予算を超えたら演出の画質を下げ，余裕が続いたら戻すクラス
+    下げる条件と上げる条件に差を付け，切り替え直後はしばらく判定しないことで画質が振動しないようにする
+    """
+    def __init__(self, enabled: bool = True, budget_ms: float = FRAME_BUDGET_MS,
+                 window: int = QUALITY_WINDOW, levels: tuple = QUALITY_LEVELS, level: int = 0):
+        """
+        引数1 enabled：Falseなら画質を変えない
+        引数2 budget_ms：1フレームの時間予算（ミリ秒）
+        引数3 window：平均するフレーム数（切り替え後に判定を休むフレーム数も同じ）
+        引数4 levels：画質の段階（先頭が最高画質）
+        引数5 level：最初の段階の番号
+        """
+        self.enabled = enabled
+        self.budget_ms = budget_ms
+        self.levels = levels
+        self.level = level
+        self.samples: deque = deque(maxlen=window)
+        self.calm = 0  # 余裕のある状態が続いているフレーム数
+        self.frame = 0
+        self.decisions: list[tuple[int, str, str, float]] = []  # (フレーム, 変更前, 変更後, 平均ミリ秒)
+
+    @property
+    def quality(self) -> QualityLevel:
+        """
+        現在の画質の段階
+        """
+        return self.levels[self.level]
+
+    def observe(self, frame_ms: float) -> bool:
+        """
+        1フレームの所要時間を記録し，必要なら画質の段階を変える
+        引数 frame_ms：フレームの所要時間（待機時間を除く，ミリ秒）
+        戻り値：段階を変えたらTrue
+        """
+        self.frame += 1
+        if not self.enabled:
+            return False
+        samples = self.samples
+        samples.append(frame_ms)
+        if len(samples) < samples.maxlen:
+            return False  # 切り替え直後（または開始直後）は平均がたまるまで待つ
+        avg = sum(samples) / len(samples)
+        if avg > self.budget_ms * QUALITY_DOWN and self.level < len(self.levels) - 1:
+            self._change(self.level + 1, avg)
+            return True
+        if avg < self.budget_ms * QUALITY_UP:
+            self.calm += 1
+            if self.calm >= QUALITY_UP_FRAMES and self.level > 0:
+                self._change(self.level - 1, avg)
+                return True
+        else:
+            self.calm = 0
+        return False
+
+    def _change(self, level: int, avg: float):
+        before = self.quality.name
+        self.level = level
+        self.samples.clear()
+        self.calm = 0
+        self.decisions.append((self.frame, before, self.quality.name, avg))
+        log.info("quality %s -> %s at frame %d (avg %.1f ms, budget %.1f ms)",
+                 before, self.quality.name, self.frame, avg, self.budget_ms)
+
+
+def use_dummy_video():
+    """
+    SDLのダミービデオドライバを使うように設定する（pg.init()より前に呼ぶこと）
+    """
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+
+def preload(warm_beams: bool = False):
+    """
+    ゲーム中に使う画像・フォントを前もって読み込む（pg.init()より後に呼ぶこと）
+    引数 warm_beams：ビーム画像テーブルも全て生成するか
+    """
+    imgs = Bird.sprites.imgs
+    sprite_cache.load("fig/beam.png")
+    Explosion.frames.get_frames(0)
+    sprite_cache.load("fig/8.png", 0, 1.5)
+    BigExplosion.atlas.warm_up()
+    text_cache.font("hgp創英角ポップ体", 30)
+    text_cache.font(None, 100)
+    if warm_beams:
+        Beam.sprites.warm_up(imgs)
+
+
+def start_preloader(warm_beams: bool = False) -> threading.Thread:
+    """
+    preload()をバックグラウンドのスレッドで開始する
+    引数 warm_beams：ビーム画像テーブルも全て生成するか
+    戻り値：開始したスレッド（終了を待つ必要はない）
+    """
+    thread = threading.Thread(target=preload, args=(warm_beams,), name="preload", daemon=True)
+    thread.start()
+    return thread
+
+
+def make_input(opts: argparse.Namespace):
+    """
+    起動オプションに応じた入力ソースを生成する
+    引数 opts：起動オプション
+    戻り値：poll()で(イベント, 押下キー)を返す入力ソース
+    """
+    if opts.replay is not None:
+        return ReplayInput(opts.replay)
+    if opts.input == "idle":
+        return ScriptedInput(idle_policy)
+    if opts.input == "random":
+        return ScriptedInput(RandomPolicy(opts.seed))
+    return KeyboardInput()
+
+
+# リプレイと方策による入力は描画1回ごとに1回進むので，fixedでは描画の速さで展開が変わってしまう
+FIXED_SCRIPTED_ERROR = "--timestep fixed はリプレイやキーボード以外の入力とは一緒に使えない（frameを使うこと）"
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """
+    起動オプションを解析する
+    引数 argv：コマンドライン引数のリスト（Noneならsys.argv）
+    戻り値：オプションのNamespace
+    """
+    parser = argparse.ArgumentParser(description="たたかえ！こうかとん")
+    parser.add_argument(
+        "--beam-warmup", choices=("lazy", "eager"), default="lazy",
+        help="ビーム画像テーブルを起動時に全て生成する(eager)か，初回発射時に生成する(lazy)か")
+    parser.add_argument(
+        "--preload", action="store_true",
+        help="最初の画面に要らない画像をバックグラウンドのスレッドで先読みする")
+    parser.add_argument(
+        "--headless", action="store_true",
+        help="SDLのダミービデオドライバで画面を出さずに動かす")
+    parser.add_argument(
+        "--seed", type=int, default=None,
+        help="爆弾の配置や爆発に使う乱数シード（指定すると同じ展開を再現できる）")
+    parser.add_argument(
+        "--input", choices=("keyboard", "idle", "random"), default="keyboard",
+        help="入力ソース（keyboard：キーボード，idle：無操作，random：ランダム操作）")
+    parser.add_argument(
+        "--fps", type=int, default=50,
+        help="1秒あたりの描画フレーム数の上限（0で上限なし）")
+    parser.add_argument(
+        "--timestep", choices=("fixed", "frame"), default=None,
+        help="fixed：実時間に対して一定間隔でゲームを進め，描画は補間する，"
+             "frame：描画1回ごとに1回進める（既定はヘッドレス時frame，それ以外fixed．"
+             "リプレイとキーボード以外の入力は描画1回ごとに1フレーム分の入力を返すので常にframeで，fixedは指定できない）")
+    parser.add_argument(
+        "--tick-rate", type=int, default=TICK_RATE,
+        help="fixed時の1秒あたりのシミュレーション更新回数")
+    parser.add_argument(
+        "--no-render", action="store_true",
+        help="描画と画面更新を省略し，ゲームの状態だけを進める")
+    parser.add_argument(
+        "--renderer", choices=("full", "dirty", "texture"), default="full",
+        help="描画方式（full：毎フレーム全面描き直し，dirty：動いた矩形だけ描き直す，"
+             "texture：SDLのRenderer/Textureで描く）")
+    parser.add_argument(
+        "--render-driver", default=None,
+        help="textureで使うSDLのレンダラーのドライバ名（software，opengl など，省略時は自動）")
+    parser.add_argument(
+        "--profile", action="store_true",
+        help="処理ごとの所要時間を記録する（F3キーで画面表示を切り替え）")
+    parser.add_argument(
+        "--trace", default=None,
+        help="終了時に記録をChromeのtrace event形式で書き出すファイル（--profileを含む）")
+    parser.add_argument(
+        "--record", default=None,
+        help="入力（イベント・押下キー・乱数シード）をリプレイファイルに記録する")
+    parser.add_argument(
+        "--replay", default=None,
+        help="リプレイファイルの入力でゲームを再生する（--fps 0で早送り）")
+    parser.add_argument(
+        "--max-ticks", type=int, default=0,
+        help="指定フレーム数で終了する（0で無制限）")
+    parser.add_argument(
+        "--pipeline", action="store_true",
+        help="シミュレーションを別スレッドで1フレーム先に進め，描画と並行させる")
+    parser.add_argument(
+        "--telemetry", default=None,
+        help="ゲーム中の出来事とフレーム時間をJSONL形式で書き出すファイル（大きくなったら切り替える）")
+    parser.add_argument(
+        "--quality", choices=("auto",) + tuple(q.name for q in QUALITY_LEVELS), default="auto",
+        help="演出の画質（auto：フレーム時間に応じて自動で上げ下げする）")
+    opts = parser.parse_args(argv)
+    if opts.timestep == "fixed" and (opts.replay is not None or opts.input != "keyboard"):
+        parser.error(FIXED_SCRIPTED_ERROR)
+    return opts
+
+
+def main(opts: argparse.Namespace | None = None, input_source=None) -> World:
+    """
+    ゲームのメイン処理
+    引数1 opts：起動オプション（Noneなら既定値）
+    引数2 input_source：入力ソース（Noneならoptsから生成，終了時にclose()する）
+    戻り値：終了時のゲーム状態（最後のラウンドのWorld）
+    """
+    if opts is None:
+        opts = parse_args([])
+    if input_source is None:
+        input_source = make_input(opts)
+    try:
+        if opts.timestep == "fixed" and isinstance(input_source, (ReplayInput, ScriptedInput)):
+            raise ValueError(FIXED_SCRIPTED_ERROR)
+        return _run(opts, input_source)
+    finally:
+        input_source.close()
+
+
+def _run(opts: argparse.Namespace, input_source) -> World:
+    """
+    画面と各部品を用意してメインループを回す
+    引数1 opts：起動オプション
+    引数2 input_source：入力ソース
+    戻り値：終了時のゲーム状態（最後のラウンドのWorld）
+    """
+    render = not opts.no_render
+    # ヘッドレス時は1ラウンドで終了する（0なら何ラウンドでも続ける）
+    max_rounds = 1 if opts.headless else 0
+    screen = None
+    if opts.renderer != "texture":
+        # textureでは描画方式の側で専用のウィンドウを作る
+        pg.display.set_caption("たたかえ！こうかとん")
+        screen = pg.display.set_mode((WIDTH, HEIGHT))
+    if opts.preload:
+        # 最初の画面に要らない画像は裏で用意しておく（eagerのビーム画像テーブルも裏で作る）
+        start_preloader(warm_beams=opts.beam_warmup == "eager")
+    elif opts.beam_warmup == "eager":
+        Beam.sprites.warm_up(Bird.sprites.imgs)
+    bg_img = pg.image.load(asset_path("fig/pg_bg.jpg"))
+    if screen is not None:
+        bg_img = bg_img.convert()
+    renderer = make_renderer(opts.renderer, screen, bg_img, opts.render_driver)
+    clock = pg.time.Clock()
+    seed, num_bombs = opts.seed, NUM_OF_BOMBS
+    if isinstance(input_source, ReplayInput):
+        # 記録時と同じ乱数シード・爆弾数で始める
+        seed, num_bombs = input_source.seed, input_source.num_bombs
+    elif seed is None and opts.record is not None:
+        # 記録するときはシードを決めておく（再生時に同じ爆弾の配置にするため）
+        seed = random.randrange(2 ** 32)
+    # ゲーム中の出来事の記録（書き出しは別スレッド）
+    telemetry = Telemetry(opts.telemetry)
+    telemetry.start()
+    game = Game(seed, num_bombs, telemetry)
+    recorder = None
+    sim = None
+    # 異常終了しても記録したリプレイや計測結果を失わないよう，後始末は必ず行う
+    try:
+        if opts.record is not None:
+            recorder = ReplayRecorder(opts.record, seed, num_bombs)
+        # チャージバー
+        charge_bar = ChargeBar()
+        # 処理ごとの時間計測（F3キーで画面表示）
+        prof = FrameProfiler(enabled=opts.profile or opts.trace is not None)
+        # fixed：実時間に合わせて一定間隔で進める，frame：描画1回につき1回進める
+        # （リプレイと方策による入力は，入力と同じく1フレームずつ進める．fixedの指定はmain()で断る）
+        fixed = (opts.timestep or ("frame" if opts.headless else "fixed")) == "fixed"
+        fixed = fixed and not isinstance(input_source, (ReplayInput, ScriptedInput))
+        stepper = FixedTimestep(opts.tick_rate)
+        # 描画が重いときは演出の画質を下げる
+        names = [q.name for q in QUALITY_LEVELS]
+        governor = QualityGovernor(enabled=opts.quality == "auto",
+                                   level=0 if opts.quality == "auto" else names.index(opts.quality))
+        pending = []  # まだシミュレーションに渡していないイベント
+        # pipeline：シミュレーションを別スレッドで1フレーム先に進め，描画と並行させる
+        if opts.pipeline:
+            sim = SimulationThread(game, charge_bar, recorder, opts.max_ticks)
+            sim.start()
+        tmr = 0  # 描画するフレームの経過フレーム数
+
+        done = False
+        while not done and (opts.max_ticks <= 0 or tmr < opts.max_ticks):
+            frame_start = time.perf_counter()
+            prof.begin_frame()
+            # イベント処理（入力の受付）
+            with prof.scope("input"):
+                events, key_lst = input_source.poll()
+            for event in events:
+                if event.type == pg.KEYDOWN and event.key == pg.K_F3:
+                    prof.toggle()
+                    renderer.invalidate()
+            pending.extend(events)
+            # 描画が遅れたときは複数回進めて追いつく（その分の描画は省略される）
+            ticks = stepper.advance() if fixed else 1
+            alpha = stepper.alpha if fixed else 1.0
+            if sim is None:
+                game.world.quality = governor.quality
+                status = run_ticks(game, pending, key_lst, ticks, recorder, prof, opts.max_ticks)
+                tmr, rounds_over = game.tmr, game.rounds_over
+            else:
+                # このフレームの入力と画質を渡してから，前のフレームの結果を描く
+                # （ゲームはシミュレーションのスレッドが進めるので，ここでは直接触らない）
+                sim.submit(pending, key_lst, ticks, alpha, governor.quality)
+                with prof.scope("wait"):
+                    snap = sim.take()
+                status, tmr, rounds_over = snap.status, snap.tmr, snap.rounds_over
+            if ticks > 0:
+                pending = []
+            if status == "quit":
+                break
+            if status is not None:
+                renderer.invalidate()  # 場面が変わるので全面を描き直す
+            if status == Game.GAME_OVER and max_rounds and rounds_over >= max_rounds:
+                done = True  # ゲームオーバー画面を1回描いてから終了する
+
+            # 画面の描画
+            if render:
+                with prof.scope("render"):
+                    renderer.begin()
+                    if sim is None:
+                        game.draw(renderer, charge_bar, alpha)
+                    else:
+                        snap.draw(renderer)
+                    prof.draw_overlay(renderer)
+                # 画面更新
+                with prof.scope("flip"):
+                    renderer.present()
+            prof.end_frame()
+            # 待機時間を含めない，このフレームの処理時間
+            frame_ms = (time.perf_counter() - frame_start) * 1000
+            governor.observe(frame_ms)
+            telemetry.frame(frame_ms)
+            clock.tick(opts.fps)
+    finally:
+        if sim is not None:
+            sim.stop()
+        if recorder is not None:
+            recorder.close()
+        telemetry.close()
+    if opts.trace is not None:
+        prof.export_chrome_trace(opts.trace)
+    return game.world
 
 # メインループ終了
 if __name__ == "__main__":
+    opts = parse_args()
+    if opts.headless:
+        use_dummy_video()
+    # 画質の切り替えなどの記録を標準エラー出力に出す
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     pg.init()
-    main()
+    main(opts)
     pg.quit()
-    sys.exit()
\ No newline at end of file
+    sys.exit()